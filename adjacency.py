@@ -0,0 +1,230 @@
+#
+# adjacency.py -- Edge adjacency graph for panes.
+#
+#	Copyright (C) 2011  Jacob Courtneay <jacob@sporkexec.com>
+#
+#	This program is free software; you can redistribute it and/or modify
+#	it under the terms of the GNU General Public License as published by
+#	the Free Software Foundation; either version 2 of the License, or
+#	(at your option) any later version.
+#
+#	This program is distributed in the hope that it will be useful,
+#	but WITHOUT ANY WARRANTY; without even the implied warranty of
+#	MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#	GNU General Public License for more details.
+#
+#	You should have received a copy of the GNU General Public License
+#	along with this program; if not, write to the Free Software
+#	Foundation, Inc., 59 Temple Place, Suite 330, Boston, MA  02111-1307  USA
+
+"""Adjacency - keep track of which panes touch which.
+
+Two panes are neighbors when they share a stretch of edge longer than
+a single point. Anything that moves a pane touches it here, and the
+graph fixes up the links of the touched panes the next time somebody
+asks for neighbors. Fixing up only walks outwards from the panes that
+used to be next to the moved one, so the cost depends on how crowded
+the area around a pane is, not on how many panes the screen has.
+
+Only needs objects with a get_edges() method returning (t, r, b, l),
+so it doesn't care about X at all."""
+
+directions = ('up', 'right', 'down', 'left')
+opposite = {'up': 'down', 'down': 'up', 'left': 'right', 'right': 'left'}
+
+def touching(a, b):
+	"""Return the direction from pane a to pane b if they share an edge.
+
+	Returns None if they don't touch, or only meet at a corner."""
+
+	t, r, b_, l = a.get_edges()
+	tt, rr, bb, ll = b.get_edges()
+	if r == ll and t < bb and tt < b_:
+		return 'right'
+	if l == rr and t < bb and tt < b_:
+		return 'left'
+	if b_ == tt and l < rr and ll < r:
+		return 'down'
+	if t == bb and l < rr and ll < r:
+		return 'up'
+	return None
+
+def near(a, b):
+	"Do the closed rectangles of a and b meet at all?"
+
+	t, r, b_, l = a.get_edges()
+	tt, rr, bb, ll = b.get_edges()
+	return l <= rr and ll <= r and t <= bb and tt <= b_
+
+
+class PaneGraph:
+	"PaneGraph - per-screen edge adjacency between panes."
+
+	def __init__(self):
+		self.links = {}		# pane -> {dir: set of panes}
+		self.dirty = set()
+
+	def __contains__(self, pane):
+		return pane in self.links
+
+	def add(self, pane):
+		"Start tracking a pane. Its links are worked out lazily."
+
+		if pane not in self.links:
+			self.links[pane] = dict([(d, set()) for d in directions])
+		self.dirty.add(pane)
+
+	def remove(self, pane):
+		"Forget about a pane, unlinking it from its neighbors."
+
+		links = self.links.pop(pane, None)
+		self.dirty.discard(pane)
+		if links is None:
+			return
+		for d, others in links.items():
+			back = opposite[d]
+			for o in others:
+				self.links[o][back].discard(pane)
+
+	def touch(self, pane):
+		"Note that a pane has changed geometry."
+
+		if pane in self.links:
+			self.dirty.add(pane)
+
+	def neighbors(self, pane, dir):
+		"Return the set of panes sharing an edge with pane on side dir."
+
+		if self.dirty:
+			self.update()
+		return self.links[pane][dir]
+
+	def update(self):
+		"Recompute the links of every touched pane."
+
+		dirty, self.dirty = self.dirty, set()
+		# Everybody that used to be near a moved pane is a place to start
+		# looking from. Grab them before we start rewriting links.
+		seeds = set(dirty)
+		for p in dirty:
+			for others in self.links[p].values():
+				seeds.update(others)
+
+		for p in dirty:
+			self.relink(p, self.search(p, seeds))
+
+	def search(self, pane, seeds):
+		"""Find every pane near pane, starting from seeds.
+
+		Panes around a pane in a tiling form a ring, and the ring is
+		connected through the graph, so a flood fill that refuses to leave
+		the neighborhood finds all of them."""
+
+		found = set()
+		queue = [s for s in seeds if s is not pane and near(pane, s)]
+		seen = set(queue)
+		seen.add(pane)
+		while queue:
+			cur = queue.pop()
+			found.add(cur)
+			for others in self.links[cur].values():
+				for o in others:
+					if o not in seen:
+						seen.add(o)
+						if near(pane, o):
+							queue.append(o)
+		return found
+
+	def relink(self, pane, candidates):
+		"Reset pane's links to whichever of candidates it touches."
+
+		links = self.links[pane]
+		for d, others in links.items():
+			back = opposite[d]
+			for o in others:
+				self.links[o][back].discard(pane)
+			others.clear()
+		for o in candidates:
+			d = touching(pane, o)
+			if d is not None:
+				links[d].add(o)
+				self.links[o][opposite[d]].add(pane)
+
+	def rebuild(self, panes):
+		"Throw everything away and relink panes from scratch."
+
+		self.links = {}
+		self.dirty = set()
+		for p in panes:
+			self.links[p] = dict([(d, set()) for d in directions])
+		for p in panes:
+			for o in panes:
+				d = touching(p, o)
+				if d is not None and o is not p:
+					self.links[p][d].add(o)
+
+	def check(self, panes):
+		"""Compare the graph against a from-scratch build.
+
+		Returns a list of (pane, dir, missing, extra) for every direction
+		that disagrees; an empty list means the graph is consistent."""
+
+		if self.dirty:
+			self.update()
+		fresh = PaneGraph()
+		fresh.rebuild(panes)
+		problems = []
+		if set(self.links.keys()) != set(fresh.links.keys()):
+			problems.append((None, None,
+				set(fresh.links.keys()) - set(self.links.keys()),
+				set(self.links.keys()) - set(fresh.links.keys())))
+		for p in panes:
+			if p not in self.links:
+				continue
+			for d in directions:
+				have, want = self.links[p][d], fresh.links[p][d]
+				if have != want:
+					problems.append((p, d, want - have, have - want))
+		return problems
+
+
+if __name__ == '__main__':
+	# Micro-benchmark: neighbor lookups through the graph against the old
+	# scan over every pane, on ever-larger grids of panes.
+	import sys, time
+
+	class Rect:
+		def __init__(self, x, y, w, h):
+			self.x, self.y, self.width, self.height = x, y, w, h
+		def get_edges(self):
+			return (self.y, self.x + self.width, self.y + self.height, self.x)
+
+	def scan(panes, pane, dir):
+		return [p for p in panes if p is not pane and touching(pane, p) == dir]
+
+	lookups = 20000
+	print '%8s %14s %14s' % ('panes', 'graph us/op', 'scan us/op')
+	for side in (2, 4, 8, 16, 32, 64):
+		panes = [Rect(x * 10, y * 10, 10, 10)
+					for x in range(side) for y in range(side)]
+		g = PaneGraph()
+		for p in panes:
+			g.add(p)
+		g.update()
+		problems = g.check(panes)
+		if problems:
+			print 'inconsistent graph:', problems[:5]
+			sys.exit(1)
+
+		middle = panes[len(panes) / 2]
+		start = time.time()
+		for i in xrange(lookups):
+			g.neighbors(middle, directions[i % 4])
+		graph_time = (time.time() - start) / lookups * 1e6
+
+		n = min(lookups, 200000 / len(panes))
+		start = time.time()
+		for i in xrange(n):
+			scan(panes, middle, directions[i % 4])
+		scan_time = (time.time() - start) / n * 1e6
+		print '%8d %14.2f %14.2f' % (len(panes), graph_time, scan_time)
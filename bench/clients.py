@@ -0,0 +1,108 @@
+#!/usr/bin/python2
+#
+# clients.py -- Synthetic X clients for the benchmarks.
+#
+# Owns any number of plain windows on one display connection and maps or
+# unmaps them when told to on stdin. Every command is answered with a line
+# on stdout once the server has seen all of the requests, so the driver
+# knows when the burst is complete.
+#
+#	map <n>		create (if needed) and map n more windows
+#	unmap <n>	unmap the n most recently mapped windows
+#	destroy		destroy every window
+#	window <x> <y> <width> <height>
+#			create and map one window, answering with its id
+#	configure <id> <mask> <x> <y> <width> <height> <stack mode>
+#			ask for the ConfigureWindow value mask says
+#	withdraw <id> [synthetic]
+#			unmap it, followed by a synthetic UnmapNotify if asked
+#	kill <id>	destroy it
+#	quit
+#
+# Kept separate from the wm so that its requests don't count against it.
+
+import sys
+from Xlib import X, Xatom, display
+from Xlib.protocol import event
+
+def main(dispname):
+	d = display.Display(dispname)
+	screen = d.screen()
+	mapped = []
+	spare = []
+	count = 0
+	windows = {}	# id -> window, from the window command
+
+	while 1:
+		line = sys.stdin.readline()
+		if not line:
+			break
+		words = line.split()
+		if not words:
+			continue
+		cmd = words[0]
+		if cmd == 'map':
+			for _ in xrange(int(words[1])):
+				if spare:
+					w = spare.pop()
+				else:
+					count += 1
+					w = screen.root.create_window(0, 0, 100, 100, 0,
+						screen.root_depth, X.InputOutput, X.CopyFromParent,
+						background_pixel = screen.black_pixel,
+						event_mask = X.StructureNotifyMask)
+					w.set_wm_name('bench-%d' % count)
+				w.map()
+				mapped.append(w)
+		elif cmd == 'unmap':
+			for _ in xrange(min(int(words[1]), len(mapped))):
+				w = mapped.pop()
+				w.unmap()
+				spare.append(w)
+		elif cmd == 'destroy':
+			for w in mapped + spare:
+				w.destroy()
+			mapped, spare = [], []
+		elif cmd == 'window':
+			x, y, width, height = map(int, words[1:5])
+			count += 1
+			w = screen.root.create_window(x, y, max(width, 1), max(height, 1), 0,
+				screen.root_depth, X.InputOutput, X.CopyFromParent,
+				background_pixel = screen.black_pixel,
+				event_mask = X.StructureNotifyMask)
+			w.set_wm_name('bench-%d' % count)
+			w.map()
+			windows[w.id] = w
+			d.sync()
+			sys.stdout.write('ok %d\n' % w.id)
+			sys.stdout.flush()
+			continue
+		elif cmd == 'configure':
+			w = windows[int(words[1])]
+			mask, x, y, width, height, stack = map(int, words[2:8])
+			keys = {}
+			for bit, name, value in ((X.CWX, 'x', x), (X.CWY, 'y', y),
+					(X.CWWidth, 'width', max(width, 1)),
+					(X.CWHeight, 'height', max(height, 1)),
+					(X.CWStackMode, 'stack_mode', stack)):
+				if mask & bit:
+					keys[name] = value
+			w.configure(**keys)
+		elif cmd == 'withdraw':
+			w = windows[int(words[1])]
+			w.unmap()
+			if len(words) > 2 and int(words[2]):
+				screen.root.send_event(event.UnmapNotify(window = w, event = screen.root,
+					from_configure = 0), event_mask = X.SubstructureRedirectMask |
+						X.SubstructureNotifyMask)
+		elif cmd == 'kill':
+			windows.pop(int(words[1])).destroy()
+		elif cmd == 'quit':
+			break
+		d.sync()
+		sys.stdout.write('ok %d\n' % len(mapped))
+		sys.stdout.flush()
+	d.close()
+
+if __name__ == '__main__':
+	main(sys.argv[1])
@@ -0,0 +1,311 @@
+#!/usr/bin/python2
+#
+# panes_bench.py -- Time pane operations against a headless X server.
+#
+# Starts an Xvfb, runs the postmortwm window manager in this process
+# against it and drives the pane code directly, with synthetic clients
+# (clients.py) in a child process supplying the windows. Every operation
+# reports wall time until the wm has handled everything it caused, X
+# requests the wm sent and reply round-trips it waited for.
+#
+#	panes_bench.py [options]
+#
+#	--json FILE		write the results as JSON
+#	--save-baseline FILE	same, meant to be compared against later
+#	--baseline FILE		compare against earlier results; exits 1 on
+#				any regression
+#	--tolerance F		allowed relative slowdown in wall time (0.25)
+#	--windows N		windows for the map/unmap storm (500)
+#	--depth N		splits in the deep layout (10)
+#	--repeat N		repetitions of the cheap operations (50)
+#	--workspaces N		workspaces to switch between (9)
+#	--workspace-windows N	windows spread over those workspaces (200)
+#	--display :N		use an already running server instead of Xvfb
+#
+# Request counts are deterministic, so any increase over the baseline is
+# a regression. Wall time is only compared beyond a small noise floor.
+
+import os, sys, time, imp, subprocess, optparse
+try:
+	import json
+except ImportError:
+	import simplejson as json
+
+here = os.path.dirname(os.path.abspath(__file__))
+top = os.path.dirname(here)
+sys.path.insert(0, top)
+
+# Must be set before any of our modules are imported.
+os.environ['POSTMORTWM_STATS'] = '1'
+
+from Xlib import display as xdisplay
+import stats
+from resize import resize_pane
+
+# load_source would leave a postmortwmc next to the script.
+sys.dont_write_bytecode = True
+postmortwm = imp.load_source('postmortwm', os.path.join(top, 'postmortwm'))
+
+# Below this, wall time differences are noise.
+noise_floor = 0.002
+directions = ('left', 'down', 'right', 'up')
+
+
+class Xvfb:
+	"A private Xvfb server, picking its own display number."
+
+	def __init__(self, width = 1280, height = 1024):
+		rfd, wfd = os.pipe()
+		self.proc = subprocess.Popen(['Xvfb', '-displayfd', str(wfd),
+			'-screen', '0', '%dx%dx24' % (width, height), '-nolisten', 'tcp'],
+			stderr = open(os.devnull, 'w'))
+		os.close(wfd)
+		number = ''
+		while not number.endswith('\n'):
+			c = os.read(rfd, 1)
+			if not c:
+				raise RuntimeError, 'Xvfb did not start'
+			number += c
+		os.close(rfd)
+		self.display = ':' + number.strip()
+
+	def stop(self):
+		self.proc.terminate()
+		self.proc.wait()
+
+
+class Clients:
+	"The synthetic client process."
+
+	def __init__(self, dispname):
+		self.proc = subprocess.Popen([sys.executable,
+			os.path.join(here, 'clients.py'), dispname],
+			stdin = subprocess.PIPE, stdout = subprocess.PIPE)
+
+	def command(self, line):
+		self.proc.stdin.write(line + '\n')
+		self.proc.stdin.flush()
+		reply = self.proc.stdout.readline()
+		if not reply.startswith('ok'):
+			raise RuntimeError, 'client process died'
+		return int(reply.split()[1])
+
+	def stop(self):
+		self.proc.stdin.write('quit\n')
+		self.proc.stdin.flush()
+		self.proc.wait()
+
+
+class Bench:
+	"Runs operations on a wm and keeps their numbers."
+
+	def __init__(self, wm, clients):
+		self.wm = wm
+		self.clients = clients
+		self.screen = wm.screens[0]
+		self.results = {}
+		self.syncs = 0
+
+		# Count every request we send, the serial number wraps too soon.
+		self.requests = 0
+		proto = wm.display.display
+		send_request = proto.send_request
+		def counting_send_request(*args, **kwargs):
+			self.requests += 1
+			return send_request(*args, **kwargs)
+		proto.send_request = counting_send_request
+		stats.hook_display(wm.display)
+
+	def pump(self):
+		"Handle events until the server has nothing more for us."
+
+		d = self.wm.display
+		while 1:
+			d.sync()
+			self.syncs += 1
+			if not d.pending_events():
+				return
+			while d.pending_events():
+				self.wm.handle_event(d.next_event())
+
+	def run(self, name, fn, ops):
+		"Time fn, which does ops operations, and everything it causes."
+
+		self.pump()
+		requests0, trips0 = self.requests, stats.roundtrips_total
+		blocked0, syncs0 = stats.blocked_total, self.syncs
+		start = time.time()
+		fn()
+		self.pump()
+		wall = time.time() - start
+		# The syncs in pump are ours, not the operation's.
+		syncs = self.syncs - syncs0
+		self.results[name] = {
+			'ops': ops,
+			'wall': wall,
+			'wall_per_op': wall / max(ops, 1),
+			'requests': self.requests - requests0 - syncs,
+			'roundtrips': stats.roundtrips_total - trips0 - syncs,
+			'blocked': stats.blocked_total - blocked0,
+			}
+
+	def deep_layout(self, depth):
+		"Split the current pane depth times, alternating directions."
+
+		for i in xrange(depth):
+			p = self.screen.current_pane
+			if i % 2:
+				p.horizontal_split()
+			else:
+				p.vertical_split()
+
+	def fill(self, per_pane):
+		"Map per_pane windows into every pane."
+
+		for p in list(self.screen.panes_list):
+			p.activate()
+			self.clients.command('map %d' % per_pane)
+			self.pump()
+
+
+def run_all(bench, opts):
+	s = bench.screen
+	wm = bench.wm
+	n = opts.repeat
+
+	s.current_pane.maximize()
+	bench.run('split-chain', lambda: bench.deep_layout(opts.depth), opts.depth)
+	bench.fill(4)
+
+	for mode in ('tree', 'ratpoison'):
+		s.panes_resize_mode = mode
+		for action in ('hgrow', 'hshrink', 'vgrow', 'vshrink'):
+			def resize(action = action):
+				for _ in xrange(n):
+					resize_pane(s.current_pane, action)
+			bench.run('resize-%s-%s' % (mode, action), resize, n)
+	s.panes_resize_mode = 'tree'
+
+	def sweep_focus():
+		for i in xrange(n):
+			wm.move_focus(directions[i % 4])
+	bench.run('move-focus-sweep', sweep_focus, n)
+
+	def sweep_window():
+		for i in xrange(n):
+			s.current_pane.move_window(directions[i % 4])
+	bench.run('move-window-sweep', sweep_window, n)
+
+	bench.run('maximize', lambda: s.current_pane.maximize(), 1)
+
+	bench.clients.command('map 100')
+	bench.pump()
+	def switch():
+		p = s.current_pane
+		for i in xrange(n):
+			p.switch_window(i % len(p.window_list))
+	bench.run('switch-window-crowded', switch, n)
+	bench.clients.command('destroy')
+	bench.pump()
+
+	bench.deep_layout(opts.depth)
+	bench.run('map-storm', lambda: bench.clients.command('map %d' % opts.windows),
+		opts.windows)
+	bench.run('unmap-storm', lambda: bench.clients.command('unmap %d' % opts.windows),
+		opts.windows)
+
+	# Every workspace gets a few panes and its share of the windows.
+	for w in xrange(opts.workspaces):
+		s.panes_switch_workspace(w)
+		bench.deep_layout(2)
+		bench.clients.command('map %d' % (opts.workspace_windows / opts.workspaces))
+		bench.pump()
+	def switch_workspace():
+		for i in xrange(n):
+			s.panes_switch_workspace(i % opts.workspaces)
+	bench.run('workspace-switch', switch_workspace, n)
+	s.panes_switch_workspace(0)
+
+
+def compare(results, baseline, tolerance):
+	"Print results next to baseline, returning the regressed names."
+
+	regressions = []
+	print '%-28s %10s %10s %9s %9s' % ('operation', 'wall ms', 'base ms',
+		'requests', 'base')
+	names = results.keys()
+	names.sort()
+	for name in names:
+		r = results[name]
+		b = baseline.get(name)
+		if b is None:
+			print '%-28s %10.2f %10s %9d %9s' % (name, r['wall'] * 1e3, '-',
+				r['requests'], '-')
+			continue
+		bad = r['requests'] > b['requests'] or \
+			(r['wall'] > b['wall'] * (1 + tolerance) and
+				r['wall'] - b['wall'] > noise_floor)
+		if bad:
+			regressions.append(name)
+		print '%-28s %10.2f %10.2f %9d %9d %s' % (name, r['wall'] * 1e3,
+			b['wall'] * 1e3, r['requests'], b['requests'], bad and 'REGRESSED' or '')
+	return regressions
+
+def main():
+	parser = optparse.OptionParser(usage = '%prog [options]')
+	parser.add_option('--json')
+	parser.add_option('--save-baseline')
+	parser.add_option('--baseline')
+	parser.add_option('--tolerance', type = 'float', default = 0.25)
+	parser.add_option('--windows', type = 'int', default = 500)
+	parser.add_option('--depth', type = 'int', default = 10)
+	parser.add_option('--repeat', type = 'int', default = 50)
+	parser.add_option('--workspaces', type = 'int', default = 9)
+	parser.add_option('--workspace-windows', type = 'int', default = 200)
+	parser.add_option('--display')
+	opts, args = parser.parse_args()
+
+	server = None
+	dispname = opts.display
+	if dispname is None:
+		server = Xvfb()
+		dispname = server.display
+	clients = Clients(dispname)
+	try:
+		wm = postmortwm.wm(xdisplay.Display(dispname))
+		bench = Bench(wm, clients)
+		bench.pump()
+		run_all(bench, opts)
+	finally:
+		clients.stop()
+		if server is not None:
+			server.stop()
+
+	out = {
+		'meta': {
+			'time': time.time(),
+			'python': sys.version.split()[0],
+			'windows': opts.windows,
+			'depth': opts.depth,
+			'repeat': opts.repeat,
+			'workspaces': opts.workspaces,
+			'workspace_windows': opts.workspace_windows,
+			},
+		'results': bench.results,
+		}
+	for path in (opts.json, opts.save_baseline):
+		if path:
+			f = open(path, 'w')
+			json.dump(out, f, indent = 1, sort_keys = True)
+			f.close()
+
+	baseline = {}
+	if opts.baseline:
+		baseline = json.load(open(opts.baseline))['results']
+	regressions = compare(bench.results, baseline, opts.tolerance)
+	if regressions:
+		print 'regressions:', ' '.join(regressions)
+		sys.exit(1)
+
+if __name__ == '__main__':
+	main()
@@ -0,0 +1,288 @@
+#!/usr/bin/python2
+#
+# replay.py -- Play an event log back and time every event.
+#
+# Feeds a log written by eventlog.py (POSTMORTWM_EVENTLOG, or 'record' on
+# the control socket) to the pane code again, starting from the layout the
+# log begins with, and reports for every kind of event (every key, for
+# keys) how long handling it took and how many X requests it sent.
+#
+#	replay.py [options] LOG
+#
+#	--xvfb			replay against a private Xvfb, with the windows
+#				played by synthetic clients (clients.py), instead
+#				of against the in-memory stand-in in sim.py
+#	--display :N		same, using an already running server
+#	--json FILE		write the results as JSON
+#
+# In memory the events are batched the way they were when recorded, and
+# the clocks the resize and configure code look at read the log's
+# timestamps, so every replay of a log does exactly the same. Against a
+# server every event is handled on its own, keys are pressed by calling
+# their keybindings, and RandR changes are skipped.
+
+import os, sys, time, imp, optparse
+try:
+	import json
+except ImportError:
+	import simplejson as json
+
+here = os.path.dirname(os.path.abspath(__file__))
+top = os.path.dirname(here)
+sys.path.insert(0, top)
+
+from Xlib import X
+import eventlog, panes, resize, sim
+
+sys.dont_write_bytecode = True
+postmortwm = imp.load_source('postmortwm', os.path.join(top, 'postmortwm'))
+
+# Restarting and profiling don't replay.
+skip_keys = ('M_q', 'M_S_p')
+
+
+class Keys(postmortwm.keybindings):
+	"The keybindings, without grabbing any keys."
+
+	def __init__(self, wm):
+		self.wm = wm
+
+class KeyEvent:
+	def __init__(self, detail, state):
+		self.type = X.KeyPress
+		self.detail, self.state = detail, state
+
+class Clock:
+	"Stands in for the time module, telling the time of the log."
+
+	def __init__(self):
+		self.now = 0.0
+
+	def time(self):
+		return self.now
+
+
+class Results:
+	"Time and requests per kind of event."
+
+	def __init__(self):
+		self.table = {}
+
+	def add(self, name, wall, requests):
+		r = self.table.get(name)
+		if r is None:
+			r = self.table[name] = {'count': 0, 'wall': 0.0, 'max': 0.0,
+				'requests': 0}
+		r['count'] += 1
+		r['wall'] += wall
+		r['max'] = max(r['max'], wall)
+		r['requests'] += requests
+
+	def report(self):
+		print '%-24s %7s %10s %10s %10s %10s' % ('event', 'count', 'total ms',
+			'us/event', 'max us', 'req/event')
+		names = self.table.keys()
+		names.sort()
+		for name in names:
+			r = self.table[name]
+			print '%-24s %7d %10.2f %10.1f %10.1f %10.2f' % (name, r['count'],
+				r['wall'] * 1e3, r['wall'] / r['count'] * 1e6, r['max'] * 1e6,
+				float(r['requests']) / r['count'])
+
+
+def event_name(kind, data):
+	if kind == 'key':
+		return 'key ' + data
+	return kind
+
+def start_state(records):
+	"""The screen sizes and layouts the log starts with.
+
+	Also returns the numbers of the screens that were zoomed in."""
+
+	sizes, saved, zoomed = {}, {}, []
+	for when, kind, screen, window, args, data in records:
+		if kind == 'screen':
+			sizes[screen] = args[:2]
+			if args[2]:
+				zoomed.append(screen)
+		elif kind == 'layout':
+			saved[screen] = data
+	return sizes, saved, zoomed
+
+
+def sim_for(records):
+	"A stand-in wm set up like the one the log was recorded on."
+
+	sizes, saved, zoomed = start_state(records)
+	width, height = sizes.get(0, (1280, 1024))
+	wm = sim.SimWM(width, height, screens = max(len(sizes), 1), saved = saved)
+	for n in zoomed:
+		wm.screens[n].panes_zoom(wm.screens[n].current_pane)
+	return wm
+
+def replay_sim(records, wm):
+	d = wm.display
+	keys = Keys(wm)
+	results = Results()
+
+	clock = Clock()
+	base = time.time()
+	panes.time = resize.time = clock
+	try:
+		for when, kind, screen, window, args, data in records:
+			if kind in ('screen', 'layout'):
+				continue
+			if kind == 'key' and data in skip_keys:
+				continue
+			clock.now = base + when
+			s = wm.screens[screen]
+			requests = d.requests()
+			start = time.time()
+			if kind == 'idle':
+				d.pending = 0
+				wm.panes_idle()
+			else:
+				# Until the next idle there's more to come.
+				d.pending = 1
+				detail = None
+				if kind == 'key':
+					detail = args[1]
+				for each in wm.screens:
+					resize.flush_resizes(each, sim.SimEvent(X.KeyPress, detail = detail))
+				if not replay_event(wm, keys, s, kind, window, args, data):
+					continue
+			results.add(event_name(kind, data), time.time() - start,
+				d.requests() - requests)
+	finally:
+		panes.time = resize.time = time
+	return results
+
+def replay_event(wm, keys, s, kind, window, (a, b, c, d, e), data):
+	"Do one event to the stand-in, returning false if it was left out."
+
+	client = s.clients.get(window)
+	if kind == 'map':
+		sim.SimClient(s, a, b, c, d, window = sim.SimWindow(wm.display, window))
+	elif kind == 'configure':
+		if client is None:
+			w = sim.SimWindow(wm.display, window)
+		else:
+			w = client.window
+		s.dispatch.dispatch_event(sim.SimEvent(X.ConfigureRequest, window = w,
+			value_mask = e & 0xffff, x = a, y = b, width = c, height = d,
+			border_width = 0, stack_mode = e >> 16))
+	elif kind == 'unmap':
+		# The wm hiding a window unmaps it; nothing to do for that here.
+		if client is None or (b and not a):
+			return 0
+		client.unmap()
+	elif kind == 'destroy':
+		if client is None:
+			return 0
+		client.withdrawn = 1
+		client.dispatch.dispatch_event(sim.SimEvent(X.DestroyNotify,
+			window = client.window))
+		del s.clients[window]
+	elif kind == 'key':
+		if data is None or not hasattr(keys, data):
+			return 0
+		getattr(keys, data)(KeyEvent(b, c))
+	elif kind == 'randr':
+		s.panes_root_resized(a, b)
+	return 1
+
+
+def replay_x(records, dispname):
+	from Xlib import Xatom, display as xdisplay
+	import persist, panes_bench
+
+	sizes, saved, zoomed = start_state(records)
+	width, height = sizes.get(0, (1280, 1024))
+	server = None
+	if dispname is None:
+		server = panes_bench.Xvfb(width, height)
+		dispname = server.display
+	clients = panes_bench.Clients(dispname)
+	try:
+		# The windows that were there to begin with are put up before the
+		# wm starts, and the layout left for it like for a restart.
+		ids = {}
+		layout = saved.get(0)
+		if layout is not None:
+			lines = layout.split('\n')
+			for i, line in enumerate(lines):
+				fields = line.split()
+				if fields[0] in ('postmortwm', 'W', 'T'):
+					continue
+				for j in range(5, len(fields)):
+					old = int(fields[j])
+					ids[old] = clients.command('window 0 0 100 100')
+					fields[j] = str(ids[old])
+				lines[i] = ' '.join(fields)
+			d = xdisplay.Display(dispname)
+			d.screen().root.change_property(d.intern_atom(persist.atom_name),
+				Xatom.STRING, 8, '\n'.join(lines))
+			d.sync()
+			d.close()
+
+		wm = postmortwm.wm(xdisplay.Display(dispname))
+		bench = panes_bench.Bench(wm, clients)
+		bench.pump()
+		for n in zoomed:
+			wm.screens[n].panes_zoom(wm.screens[n].current_pane)
+		bench.pump()
+		keys = Keys(wm)
+		results = Results()
+		for when, kind, screen, window, (a, b, c, d, e), data in records:
+			if kind == 'map':
+				def fn(window = window, a = a, b = b, c = c, d = d):
+					ids[window] = clients.command('window %d %d %d %d' % (a, b, c, d))
+			elif kind == 'configure' and ids.has_key(window):
+				def fn(w = ids[window], a = a, b = b, c = c, d = d, e = e):
+					clients.command('configure %d %d %d %d %d %d %d' % (w,
+						e & 0xffff, a, b, c, d, e >> 16))
+			elif kind == 'unmap' and ids.has_key(window) and (a or not b):
+				def fn(w = ids[window], a = a):
+					clients.command('withdraw %d %d' % (w, a))
+			elif kind == 'destroy' and ids.has_key(window):
+				def fn(w = ids.pop(window)):
+					clients.command('kill %d' % w)
+			elif kind == 'key' and data not in skip_keys and hasattr(keys, data):
+				def fn(name = data, b = b, c = c):
+					getattr(keys, name)(KeyEvent(b, c))
+			else:
+				continue
+			bench.run('event', fn, 1)
+			r = bench.results.pop('event')
+			results.add(event_name(kind, data), r['wall'], r['requests'])
+		return results
+	finally:
+		clients.stop()
+		if server is not None:
+			server.stop()
+
+
+def main():
+	parser = optparse.OptionParser(usage = '%prog [options] LOG')
+	parser.add_option('--xvfb', action = 'store_true')
+	parser.add_option('--display')
+	parser.add_option('--json')
+	opts, args = parser.parse_args()
+	if len(args) != 1:
+		parser.error('which log?')
+
+	records = eventlog.read(args[0])
+	if opts.xvfb or opts.display:
+		results = replay_x(records, opts.display)
+	else:
+		results = replay_sim(records, sim_for(records))
+	results.report()
+	if opts.json:
+		f = open(opts.json, 'w')
+		json.dump({'log': args[0], 'results': results.table}, f, indent = 1,
+			sort_keys = True)
+		f.close()
+
+if __name__ == '__main__':
+	main()
@@ -0,0 +1,383 @@
+#
+# control.py -- Drive the wm through a Unix socket.
+#
+#	Copyright (C) 2011  Jacob Courtneay <jacob@sporkexec.com>
+#
+#	This program is free software; you can redistribute it and/or modify
+#	it under the terms of the GNU General Public License as published by
+#	the Free Software Foundation; either version 2 of the License, or
+#	(at your option) any later version.
+#
+#	This program is distributed in the hope that it will be useful,
+#	but WITHOUT ANY WARRANTY; without even the implied warranty of
+#	MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#	GNU General Public License for more details.
+#
+#	You should have received a copy of the GNU General Public License
+#	along with this program; if not, write to the Free Software
+#	Foundation, Inc., 59 Temple Place, Suite 330, Boston, MA  02111-1307  USA
+
+"""Control - a command socket, like ratpoison -c or i3-msg.
+
+ControlManager is a WindowManager mixin that listens on a Unix socket,
+/tmp/postmortwm-<uid>-<display> unless POSTMORTWM_SOCKET says otherwise.
+The socket is just another file in plwm's event loop and never blocks.
+
+Commands are lines of words. Every command gets a reply line starting
+with 'ok' or 'error', some followed by more lines as the reply says:
+
+	split v|h [fraction]	split the current pane
+	resize hgrow|hshrink|vgrow|vshrink [pixels]
+	focus left|right|up|down|<pane number>
+	move left|right|up|down	give the current window to a neighbor
+	switch <n>		show the n'th window of the current pane
+	maximize
+	remove			close the current pane, its neighbors take its space
+	zoom			let the current pane fill the screen, or stop that
+	workspace <n>		show workspace n instead
+	send <n>		put the current window on workspace n
+	profile [seconds [file]]	sample the wm for a while, 'ok <file>'
+	profile stop		stop sampling early and write the file
+	record <file>		log the events the panes see to file, see eventlog.py
+	record stop
+	apply <layout> [spread|stack]	replace the panes with a named layout
+	layout			'ok <n>', then one line per pane:
+				<x> <y> <width> <height> <windows> <current>
+	begin ... end		run everything in between as one batch
+
+Everything that arrives in one read is run as one batch: the panes get
+moved around, then every window that moved is reconfigured once and the
+focus changes once, in one flush. So clients that send a whole script at
+once get it done atomically.
+
+Running this file sends its arguments, or its standard input if there
+are none, as commands and prints the replies."""
+
+import os, sys, socket, errno, fcntl, traceback
+from plwm import event
+from resize import resize_pane
+
+ControlFileEvent = event.new_event_type()
+
+def socket_path(display_name):
+	"Where the control socket of the wm on display_name lives."
+
+	path = os.environ.get('POSTMORTWM_SOCKET')
+	if path:
+		return path
+	# The screen number doesn't matter, the wm has all of them.
+	host, sep, rest = display_name.rpartition(':')
+	return '/tmp/postmortwm-%d-%s:%s' % (os.getuid(), host, rest.split('.')[0])
+
+def log_exception(what):
+	"Tell stderr what went wrong doing what, traceback and all."
+
+	sys.stderr.write('postmortwm: %s failed\n' % what)
+	traceback.print_exc()
+
+def close_on_exec(sock):
+	"Don't hand sock down to the programs we run, or to ourselves on M_q."
+
+	flags = fcntl.fcntl(sock.fileno(), fcntl.F_GETFD)
+	fcntl.fcntl(sock.fileno(), fcntl.F_SETFD, flags | fcntl.FD_CLOEXEC)
+
+class Connection:
+	"Connection - one client of the control socket."
+
+	def __init__(self, control, sock):
+		self.control = control
+		self.sock = sock
+		self.sock.setblocking(0)
+		close_on_exec(sock)
+		self.inbuf = ''
+		self.outbuf = ''
+		self.batch = None		# commands since 'begin', if any
+		self.eof = 0
+		self.event = event.FileEvent(ControlFileEvent, sock, event.FileEvent.READ)
+
+	def read(self):
+		"Read whatever is there and run the commands in it."
+
+		data = []
+		while 1:
+			try:
+				chunk = self.sock.recv(4096)
+			except socket.error, e:
+				if e.args[0] not in (errno.EAGAIN, errno.EWOULDBLOCK, errno.EINTR):
+					self.eof = 1
+				break
+			if not chunk:
+				self.eof = 1
+				break
+			data.append(chunk)
+		if data:
+			self.received(''.join(data))
+
+	def received(self, data):
+		lines = (self.inbuf + data).split('\n')
+		self.inbuf = lines.pop()
+		commands = []
+		for line in lines:
+			words = line.split()
+			if not words:
+				continue
+			if words[0] == 'begin' and self.batch is None:
+				self.batch = []
+			elif words[0] == 'end' and self.batch is not None:
+				commands.extend(self.batch)
+				self.batch = None
+			elif self.batch is not None:
+				self.batch.append(words)
+			else:
+				commands.append(words)
+		if commands:
+			self.outbuf += ''.join(self.control.run(commands))
+			self.write()
+
+	def write(self):
+		"Send as much of the replies as the socket takes."
+
+		while self.outbuf:
+			try:
+				sent = self.sock.send(self.outbuf)
+			except socket.error, e:
+				if e.args[0] not in (errno.EAGAIN, errno.EWOULDBLOCK, errno.EINTR):
+					# Nobody's listening any more.
+					self.outbuf = ''
+					self.eof = 1
+				break
+			self.outbuf = self.outbuf[sent:]
+		# Only wait for the socket to take more if there's more to send,
+		# and stop reading once the client has said all it will.
+		mode = 0
+		if not self.eof:
+			mode = event.FileEvent.READ
+		if self.outbuf:
+			mode = mode | event.FileEvent.WRITE
+		self.event.set_mode(mode)
+
+	def done(self):
+		return self.eof and not self.outbuf
+
+	def close(self):
+		self.event.cancel()
+		self.sock.close()
+
+
+class Control:
+	"Control - the socket, its connections and the commands."
+
+	def __init__(self, wm, path):
+		self.wm = wm
+		self.path = path
+		self.connections = {}	# socket -> Connection
+
+		if os.path.exists(path):
+			os.unlink(path)
+		self.listener = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+		old = os.umask(077)
+		try:
+			try:
+				self.listener.bind(path)
+			finally:
+				os.umask(old)
+		except socket.error:
+			self.listener.close()
+			raise
+		self.listener.listen(16)
+		self.listener.setblocking(0)
+		close_on_exec(self.listener)
+		self.listen_event = event.FileEvent(ControlFileEvent, self.listener,
+			event.FileEvent.READ)
+		wm.events.add_file(self.listen_event)
+		wm.dispatch.add_handler(ControlFileEvent, self.handle)
+
+	def handle(self, ev):
+		"One of our sockets is ready."
+
+		# Nothing a client does should take the wm down with it.
+		try:
+			self.handle_file(ev)
+		except Exception:
+			log_exception('control socket')
+			conn = self.connections.pop(ev.file, None)
+			if conn is not None:
+				conn.close()
+
+	def handle_file(self, ev):
+		if ev.file is self.listener:
+			self.accept()
+			return
+		conn = self.connections.get(ev.file)
+		if conn is None:
+			return
+		if not conn.eof:
+			conn.read()
+		conn.write()
+		if conn.done():
+			del self.connections[conn.sock]
+			conn.close()
+
+	def accept(self):
+		while 1:
+			try:
+				sock, address = self.listener.accept()
+			except socket.error:
+				return
+			conn = Connection(self, sock)
+			self.connections[sock] = conn
+			self.wm.events.add_file(conn.event)
+
+	def run(self, commands):
+		"""Run a list of commands, each a list of words, as one batch.
+
+		Returns the replies."""
+
+		screens = self.wm.screens
+		for s in screens:
+			s.panes_begin()
+		try:
+			return [self.command(words) for words in commands]
+		finally:
+			for s in screens:
+				s.panes_commit()
+
+	def command(self, words):
+		fn = getattr(self, 'cmd_' + words[0], None)
+		if fn is None:
+			return 'error unknown command %s\n' % words[0]
+		try:
+			out = fn(*words[1:])
+		except (TypeError, ValueError, KeyError, IndexError), e:
+			return 'error %s: %s\n' % (words[0], e)
+		except Exception, e:
+			log_exception(' '.join(words))
+			return 'error %s: %s: %s\n' % (words[0], e.__class__.__name__, e)
+		if out is None:
+			return 'ok\n'
+		return out
+
+	def pane(self):
+		return self.wm.current_screen.current_pane
+
+	def cmd_split(self, how, frac = '.5'):
+		if how not in ('v', 'h'):
+			raise ValueError, 'split v or h, not %s' % how
+		frac = float(frac)
+		if not 0 < frac < 1:
+			raise ValueError, 'fraction %r is not between 0 and 1' % frac
+		pane = self.pane()
+		size = how == 'v' and pane.width or pane.height
+		# Both halves have to be at least a pixel, or X won't have them.
+		if int(size * frac) < 1 or size - int(size * frac) < 1:
+			raise ValueError, 'pane is too small to split at %r' % frac
+		if how == 'v':
+			pane.vertical_split(frac)
+		else:
+			pane.horizontal_split(frac)
+
+	def cmd_resize(self, action, diff = '10'):
+		if action not in ('hgrow', 'hshrink', 'vgrow', 'vshrink'):
+			raise ValueError, 'no such resize: %s' % action
+		resize_pane(self.pane(), action, int(diff))
+
+	def cmd_focus(self, where):
+		if where in ('left', 'right', 'up', 'down'):
+			self.wm.move_focus(where)
+		else:
+			self.wm.current_screen.panes_list[int(where)].activate()
+
+	def cmd_move(self, dir):
+		if dir not in ('left', 'right', 'up', 'down'):
+			raise ValueError, 'no such direction: %s' % dir
+		self.pane().move_window(dir)
+
+	def cmd_switch(self, index):
+		self.pane().switch_window(int(index))
+
+	def cmd_maximize(self):
+		self.pane().maximize()
+
+	def cmd_remove(self):
+		if not self.pane().remove():
+			raise ValueError, 'no neighbor can take the pane over'
+
+	def cmd_zoom(self):
+		self.pane().zoom()
+
+	def cmd_workspace(self, n):
+		self.wm.current_screen.panes_switch_workspace(int(n))
+
+	def cmd_send(self, n):
+		window = self.pane().window
+		if window is None:
+			raise ValueError, 'no window to send'
+		self.wm.current_screen.panes_send_window(window, int(n))
+
+	def cmd_profile(self, seconds = '10', path = None):
+		if seconds == 'stop':
+			self.wm.sampler_done()
+			return
+		path = self.wm.sampler_profile(float(seconds), path)
+		if path is None:
+			raise ValueError, 'already profiling'
+		return 'ok %s\n' % path
+
+	def cmd_record(self, path):
+		if path == 'stop':
+			self.wm.eventlog_stop()
+		else:
+			try:
+				self.wm.eventlog_start(path)
+			except IOError, e:
+				raise ValueError, str(e)
+
+	def cmd_apply(self, name, policy = 'spread'):
+		self.wm.current_screen.panes_apply_layout(name, policy)
+
+	def cmd_layout(self):
+		s = self.wm.current_screen
+		lines = ['ok %d' % len(s.panes_list)]
+		for p in s.panes_list:
+			lines.append('%d %d %d %d %d %d' % (p.x, p.y, p.width, p.height,
+				len(p.window_list), p is s.current_pane))
+		return '\n'.join(lines) + '\n'
+
+
+class ControlManager:
+	"ControlManager - WindowManager mixin running a Control."
+
+	def __wm_init__(self):
+		path = socket_path(self.display.get_display_name())
+		try:
+			self.control = Control(self, path)
+		except (socket.error, OSError), e:
+			# Carry on without one rather than not start.
+			sys.stderr.write('postmortwm: no control socket at %s: %s\n'
+				% (path, e))
+			self.control = None
+
+
+def main(args):
+	sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+	sock.connect(socket_path(os.environ.get('DISPLAY', ':0')))
+	if args:
+		sock.sendall(' '.join(args) + '\n')
+	else:
+		sock.sendall(sys.stdin.read())
+	sock.shutdown(socket.SHUT_WR)
+	replies = []
+	while 1:
+		data = sock.recv(4096)
+		if not data:
+			break
+		replies.append(data)
+	replies = ''.join(replies)
+	sys.stdout.write(replies)
+	for line in replies.split('\n'):
+		if line.startswith('error'):
+			return 1
+	return 0
+
+if __name__ == '__main__':
+	sys.exit(main(sys.argv[1:]))
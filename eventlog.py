@@ -0,0 +1,194 @@
+#
+# eventlog.py -- Record the events the panes see, for replaying later.
+#
+#	Copyright (C) 2011  Jacob Courtneay <jacob@sporkexec.com>
+#
+#	This program is free software; you can redistribute it and/or modify
+#	it under the terms of the GNU General Public License as published by
+#	the Free Software Foundation; either version 2 of the License, or
+#	(at your option) any later version.
+#
+#	This program is distributed in the hope that it will be useful,
+#	but WITHOUT ANY WARRANTY; without even the implied warranty of
+#	MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#	GNU General Public License for more details.
+#
+#	You should have received a copy of the GNU General Public License
+#	along with this program; if not, write to the Free Software
+#	Foundation, Inc., 59 Temple Place, Suite 330, Boston, MA  02111-1307  USA
+
+"""EventLog - a binary log of what the wm was asked to do.
+
+The pane code calls record() as events reach its handlers: windows
+being mapped, configure requests, unmaps and destroys, RandR size
+changes, and keybindings, which instrument_keys() wraps. 'idle' is
+recorded whenever the wm has handled every event it had queued, so a
+replay can batch the same events together as the wm did. While not
+recording, record() is a function call that returns straight away.
+
+A log starts with an 8 byte magic and a version, then fixed-size
+records: a timestamp in seconds since the start, the kind, a screen
+number, a window id and five integers whose meaning depends on the
+kind. Kinds with a string ('name' and 'layout') have its length in the
+last integer and the string right after the record. Every log starts
+with a 'screen' and a 'layout' record per screen describing what was
+there already, the layout being what persist.encode() gives. That
+leaves out a zoom, so the third integer of 'screen' is 1 for a screen
+that's zoomed in on its current pane.
+
+EventLogManager is a WindowManager mixin that starts recording to the
+file POSTMORTWM_EVENTLOG names, if it's set. bench/replay.py plays a log
+back against the in-memory stand-in or an Xvfb."""
+
+import os, struct, time
+import persist
+
+magic = 'PMWEVLOG'
+version = 1
+header_format = '<8sH'
+record_format = '<dBBxxIiiiiI'
+record_size = struct.calcsize(record_format)
+
+kinds = ('name', 'screen', 'layout', 'map', 'configure', 'unmap', 'destroy',
+	'key', 'randr', 'idle')
+kind_codes = dict([(k, i) for i, k in enumerate(kinds)])
+
+names = []		# code -> name, for keys
+name_codes = {}	# name -> code
+
+def name_code(name):
+	"Return the code for a key name, registering it if needed."
+
+	code = name_codes.get(name)
+	if code is None:
+		code = name_codes[name] = len(names)
+		names.append(name)
+	return code
+
+log = None
+log_path = None
+started = 0.0
+written = set()		# name codes defined in the log so far
+
+def _write(kind, screen, window, a, b, c, d, e, data = None):
+	if data is not None:
+		e = len(data)
+	log.write(struct.pack(record_format, time.time() - started,
+		kind_codes[kind], screen, window, a, b, c, d, e))
+	if data is not None:
+		log.write(data)
+
+def _record(kind, screen = 0, window = 0, a = 0, b = 0, c = 0, d = 0, e = 0):
+	if kind == 'key' and a not in written:
+		written.add(a)
+		_write('name', 0, 0, a, 0, 0, 0, 0, names[a])
+	_write(kind, screen, window, a, b, c, d, e)
+
+def _norecord(kind, screen = 0, window = 0, a = 0, b = 0, c = 0, d = 0, e = 0):
+	pass
+
+record = _norecord
+
+def start(path, screens):
+	"Start recording to path, beginning with the state of screens."
+
+	global log, log_path, started, record
+	stop()
+	log = open(path, 'wb')
+	log_path = path
+	log.write(struct.pack(header_format, magic, version))
+	started = time.time()
+	written.clear()
+	for s in screens:
+		_write('screen', s.number, 0, s.root_width, s.root_height,
+			s.panes_zoomed is not None, 0, 0)
+		_write('layout', s.number, 0, 0, 0, 0, 0, 0, persist.encode(s))
+	record = _record
+
+def stop():
+	"Stop recording, returning the path of the log if there was one."
+
+	global log, log_path, record
+	record = _norecord
+	if log is None:
+		return None
+	log.close()
+	path = log_path
+	log = log_path = None
+	return path
+
+def recording():
+	return log is not None
+
+def read(path):
+	"""Return the records in the log at path.
+
+	Each is (time, kind, screen, window, (a, b, c, d, e), data), where
+	data is the string of a 'layout' record and the key name of a 'key'
+	record, None otherwise. 'name' records are dealt with here."""
+
+	f = open(path, 'rb')
+	try:
+		head = f.read(struct.calcsize(header_format))
+		if len(head) < struct.calcsize(header_format) or \
+				struct.unpack(header_format, head) != (magic, version):
+			raise ValueError, '%s is not an event log' % path
+		keys = {}
+		out = []
+		while 1:
+			raw = f.read(record_size)
+			if len(raw) < record_size:
+				# A wm that died mid-write leaves half a record.
+				break
+			when, code, screen, window, a, b, c, d, e = \
+				struct.unpack(record_format, raw)
+			kind = kinds[code]
+			data = None
+			if kind in ('name', 'layout'):
+				data = f.read(e)
+				if len(data) < e:
+					break
+			if kind == 'name':
+				keys[a] = data
+				continue
+			if kind == 'key':
+				data = keys.get(a)
+			out.append((when, kind, screen, window, (a, b, c, d, e), data))
+		return out
+	finally:
+		f.close()
+
+def instrument_keys(cls):
+	"""Record every public method of cls being called, as a key.
+
+	Meant for keys.KeyHandler subclasses, where each method is a key."""
+
+	for name, value in cls.__dict__.items():
+		if name[0] == '_' or not callable(value):
+			continue
+		setattr(cls, name, recorded_key(name, value))
+
+def recorded_key(name, function):
+	code = name_code(name)
+	def recorded(self, event):
+		record('key', self.wm.current_screen.number, 0, code,
+			event.detail, event.state)
+		return function(self, event)
+	recorded.__name__ = function.__name__
+	recorded.__doc__ = function.__doc__
+	return recorded
+
+
+class EventLogManager:
+	"EventLogManager - WindowManager mixin recording if asked to at startup."
+
+	def __wm_init__(self):
+		path = os.environ.get('POSTMORTWM_EVENTLOG')
+		if path:
+			self.eventlog_start(path)
+
+	def eventlog_start(self, path):
+		start(path, self.screens)
+
+	def eventlog_stop(self):
+		return stop()
@@ -24,6 +24,7 @@
 
 import sys
 from plwm import wmanager, cfilter
+import tracing
 
 class MoveFocus:
 	def move_focus(self, dir):
@@ -40,6 +41,10 @@ class MoveFocus:
 
 		if screen.current_pane:
 			neighbor = screen.current_pane.get_neighbor(dir)
+			tracing.debug('MoveFocus', 'Moving focus %s from %s to %s',
+							dir, screen.current_pane, neighbor)
+			tracing.record('move-focus-' + dir, screen.current_pane.x,
+							screen.current_pane.y)
 			if neighbor is not None:
 				neighbor.activate()
 		else:
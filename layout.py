@@ -0,0 +1,197 @@
+#
+# layout.py -- Remember how panes were split.
+#
+#	Copyright (C) 2011  Jacob Courtneay <jacob@sporkexec.com>
+#
+#	This program is free software; you can redistribute it and/or modify
+#	it under the terms of the GNU General Public License as published by
+#	the Free Software Foundation; either version 2 of the License, or
+#	(at your option) any later version.
+#
+#	This program is distributed in the hope that it will be useful,
+#	but WITHOUT ANY WARRANTY; without even the implied warranty of
+#	MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#	GNU General Public License for more details.
+#
+#	You should have received a copy of the GNU General Public License
+#	along with this program; if not, write to the Free Software
+#	Foundation, Inc., 59 Temple Place, Suite 330, Boston, MA  02111-1307  USA
+
+"""Layout - a binary tree of splits behind the panes of a screen.
+
+Every split of a pane turns it into a Split node with the old pane as
+the first (left or top) child and the new pane as the second one. The
+node remembers what fraction of its area went to the second child, so
+moving a divider is just a matter of changing one ratio and laying out
+the panes under that node again.
+
+Leaves are whatever objects the screen uses as panes; all we need from
+them is x, y, width, height and get_edges()."""
+
+class Split:
+	"Split - an inner node of a SplitTree, dividing its area in two."
+
+	def __init__(self, vertical, ratio, first, second):
+		# vertical splits put first left of second, horizontal ones on top.
+		self.vertical = vertical
+		# Fraction of the area that belongs to second.
+		self.ratio = ratio
+		self.first, self.second = first, second
+
+	def __repr__(self):
+		return '<Split %s %.3f>' % (self.vertical and 'v' or 'h', self.ratio)
+
+
+def divide(total, ratio):
+	"Split total pixels by ratio, returning (first, second)."
+
+	second = int(total * ratio + .5)
+	return total - second, second
+
+
+class SplitTree:
+	"SplitTree - the splits that produced the panes on a screen."
+
+	def __init__(self, root):
+		self.root = root
+		self.parents = {root: None}
+		stack = [root]
+		while stack:
+			n = stack.pop()
+			if isinstance(n, Split):
+				for child in (n.first, n.second):
+					self.parents[child] = n
+					stack.append(child)
+
+	def __contains__(self, node):
+		return node in self.parents
+
+	def split(self, pane, new_pane, vertical):
+		"""Record that new_pane was cut off the right or bottom of pane.
+
+		Both panes must already have their post-split geometry."""
+
+		if vertical:
+			size, total = new_pane.width, pane.width + new_pane.width
+		else:
+			size, total = new_pane.height, pane.height + new_pane.height
+		node = Split(vertical, float(size) / total, pane, new_pane)
+		self.replace(pane, node)
+		self.parents[pane] = self.parents[new_pane] = node
+		return node
+
+	def remove(self, pane):
+		"""Drop a pane from the tree, its sibling taking over the parent.
+
+		Returns the sibling, or None if pane was the root. Geometry is left
+		for the caller to fix up."""
+
+		parent = self.parents.pop(pane)
+		if parent is None:
+			self.root = None
+			return None
+		if parent.first is pane:
+			sibling = parent.second
+		else:
+			sibling = parent.first
+		self.replace(parent, sibling)
+		del self.parents[parent]
+		return sibling
+
+	def replace(self, old, new):
+		"Put new where old used to be in the tree."
+
+		parent = self.parents.get(old)
+		self.parents[new] = parent
+		if parent is None:
+			self.root = new
+		elif parent.first is old:
+			parent.first = new
+		else:
+			parent.second = new
+
+	def leaves(self, node = None):
+		"Return the panes under node, left to right and top to bottom."
+
+		if node is None:
+			node = self.root
+		out = []
+		stack = [node]
+		while stack:
+			n = stack.pop()
+			if isinstance(n, Split):
+				stack.append(n.second)
+				stack.append(n.first)
+			else:
+				out.append(n)
+		return out
+
+	def get_edges(self, node):
+		"Return the (top, right, bottom, left) edges covered by node."
+
+		first = last = node
+		while isinstance(first, Split):
+			first = first.first
+		while isinstance(last, Split):
+			last = last.second
+		return (first.y, last.x + last.width, last.y + last.height, first.x)
+
+	def divider(self, pane, vertical):
+		"""Find the divider to move when resizing pane along an axis.
+
+		Prefers the divider on the right (or bottom) of pane, like
+		ratpoison does, then the one on the left (or top). Returns the node
+		and whether pane sits in its first child, or (None, None)."""
+
+		for first in (1, 0):
+			child, node = pane, self.parents[pane]
+			while node is not None:
+				if node.vertical == vertical and (node.first is child) == first:
+					return node, first
+				child, node = node, self.parents[node]
+		return None, None
+
+	def layout(self, node, x, y, width, height, out):
+		"Work out the geometry of every pane under node into out."
+
+		stack = [(node, x, y, width, height)]
+		while stack:
+			n, x, y, width, height = stack.pop()
+			if not isinstance(n, Split):
+				out[n] = (x, y, width, height)
+			elif n.vertical:
+				w1, w2 = divide(width, n.ratio)
+				stack.append((n.first, x, y, w1, height))
+				stack.append((n.second, x + w1, y, w2, height))
+			else:
+				h1, h2 = divide(height, n.ratio)
+				stack.append((n.first, x, y, width, h1))
+				stack.append((n.second, x, y + h1, width, h2))
+		return out
+
+
+# Named layouts for panesScreen.panes_apply_layout. A layout is None for
+# a single pane, or ('v' or 'h', ratio, first, second) for a split, the
+# ratio being the second child's share like in Split.
+_row3 = ('h', 2. / 3, None, ('h', .5, None, None))
+templates = {
+	'full': None,
+	'columns': ('v', .5, None, None),
+	'rows': ('h', .5, None, None),
+	'main': ('v', .35, None, ('h', .5, None, None)),
+	'grid': ('v', .5, ('h', .5, None, None), ('h', .5, None, None)),
+	'grid3': ('v', 2. / 3, _row3, ('v', .5, _row3, _row3)),
+}
+
+def build(template, new_pane):
+	"""Turn a layout template into a tree of Splits.
+
+	new_pane is called for every leaf, left to right and top to bottom."""
+
+	if template is None:
+		return new_pane()
+	how, ratio, first, second = template
+	if how not in ('v', 'h') or not 0 < ratio < 1:
+		raise ValueError, 'bad split in layout: %r' % (template,)
+	first = build(first, new_pane)
+	return Split(how == 'v', float(ratio), first, build(second, new_pane))
@@ -28,42 +28,194 @@ themselves to fit that pane.
 
 The rest of the UI - well, that's up to you."""
 
+import time
 from Xlib import X, Xutil, Xatom
-from plwm import wmanager, wmevents, modewindow, cfilter
+from Xlib.protocol import event as xevent
 try:
-	from functools import partial # Python >= 2.5
+	from Xlib.ext import shape
+	try:
+		shape_set, shape_bounding = shape.SO.Set, shape.SK.Bounding
+	except AttributeError: # Older python-xlib
+		shape_set, shape_bounding = shape.ShapeSet, shape.ShapeBounding
 except ImportError, e:
-	def partial(fun, **kwargs):
-		def wrapper(*args_called, **kwargs_called):
-			kw = dict(kwargs)
-			kw.update(kwargs_called)
-			return fun(*args_called, **kw)
-		return wrapper
+	shape = None
+try:
+	from Xlib.ext import randr
+except ImportError:
+	randr = None
+from plwm import wmanager, wmevents, modewindow, cfilter
+from adjacency import PaneGraph
+import layout
+from layout import SplitTree
+import persist, propcache, resize, tracing, stats, eventlog
 
 
-WM_TRANSIENT_FOR = None
 class panesScreen:
 	"paneScreen - pane mixin for Screens."
 
 	panes_window_gravity = X.CenterGravity
 	panes_maxsize_gravity = X.CenterGravity
 	panes_transient_gravity = X.CenterGravity
+	# 'tree' resizes by moving dividers in panes_tree, 'ratpoison' pushes
+	# touching edges around like ratpoison does.
+	panes_resize_mode = 'tree'
+	# A window asking for more than panes_configure_limit geometry
+	# changes within panes_configure_period seconds is ignored for the
+	# rest of the period.
+	panes_configure_limit = 20
+	panes_configure_period = 1.0
+	# Iconify the windows stacked under the one a pane shows, and only
+	# resize them once they're brought forward again.
+	panes_iconify_hidden = 0
 
 	def __screen_client_init__(self):
 		"Create the initial pane object for this screen."
-		global WM_TRANSIENT_FOR
-		# Warning - if we manage more than one display, this breaks!
-		if not WM_TRANSIENT_FOR:
-			WM_TRANSIENT_FOR = self.wm.display.intern_atom("WM_TRANSIENT_FOR")
 
+		self.panes_props = propcache.cache(self.wm.display)
 		self.panes_list = []
+		self.panes_graph = PaneGraph()
 		self.current_pane = None
-
-		wmanager.debug('panesScreen', 'Initializing screen %d', self.number)
-		self.dispatch.add_handler(X.ConfigureRequest, self.panes_configure)
+		self.panes_batch = 0
+		self.panes_pending = {}
+		self.panes_pending_focus = None
+		self.panes_focused = None	# The pane that last really got the focus.
+		self.panes_pending_shown = {}
+		self.panes_restoring = None
+		self.panes_configures = {}
+		self.panes_prefetched = set()
+		self.panes_zoomed = None
+		# The workspace on show, and the layouts of all the others as
+		# (panes_list, panes_tree, panes_graph, current_pane).
+		self.panes_workspace = 0
+		self.panes_workspaces = {}
+
+		tracing.debug('panesScreen', 'Initializing screen %d', self.number)
+		self.dispatch.add_handler(X.ConfigureRequest,
+			stats.timed('panes_configure', self.panes_configure))
+		screen_change = None
+		if randr is not None and self.wm.display.has_extension('RANDR'):
+			# python-xlib only has it if the server's RandR is new enough.
+			screen_change = getattr(self.wm.display.extension_event,
+				'ScreenChangeNotify', None)
+		if screen_change is not None:
+			self.root.xrandr_select_input(randr.RRScreenChangeNotifyMask)
+			self.dispatch.add_handler(screen_change, self.panes_screen_change)
+		else:
+			# Without it, the root window being resized tells us.
+			mask = self.root.get_attributes().your_event_mask
+			self.root.change_attributes(event_mask = mask | X.StructureNotifyMask)
+			self.dispatch.add_handler(X.ConfigureNotify, self.panes_root_configure)
+		self.panes_prefetch()
+		saved = persist.load(self)
+		if saved is not None:
+			self.panes_restore(saved)
+			return
 		pane = Pane(self, 0, 0, self.root_width, self.root_height)
 		self.panes_fullscreen(pane)
+		self.panes_tree = SplitTree(pane)
 		self.panes_add(pane)
+		# Windows that are already there get adopted next. Place them all
+		# and focus once, in __screen_init__.
+		self.panes_begin()
+
+	def __screen_init__(self):
+		"All existing windows are managed now, finish adopting them."
+
+		# Windows that weren't adopted are none of our business.
+		for wid in self.panes_prefetched:
+			self.panes_props.forget(wid)
+		self.panes_prefetched = set()
+		if self.panes_restoring is not None:
+			self.panes_restore_done()
+		else:
+			self.panes_commit()
+
+	def panes_prefetch(self):
+		"""Ask for what __client_init__ needs of every existing window.
+
+		The requests all go out before any reply is waited for, instead of
+		one round-trip per window as they get adopted."""
+
+		for window in self.root.query_tree().children:
+			self.panes_props.prefetch(window, 'WM_TRANSIENT_FOR', Xatom.WINDOW)
+			self.panes_prefetched.add(window.id)
+
+	def panes_save(self):
+		"Remember the panes and their windows for after a restart."
+
+		self.panes_unzoom()
+		persist.save(self)
+
+	def panes_restore(self, saved):
+		"""Recreate the panes saved by panes_save before a restart.
+
+		Windows that get adopted while we're restoring go straight into the
+		pane they were in, and all their geometry goes out in one batch when
+		panes_restore_done is called."""
+
+		workspace, layouts = saved
+		self.panes_restoring = {}
+		for n, current, tree, saved_panes in layouts:
+			self.panes_workspace = n
+			self.panes_list = []
+			self.panes_graph = PaneGraph()
+			self.current_pane = None
+			for (x, y, width, height), visible, ids in saved_panes:
+				pane = Pane(self, x, y, width, height)
+				self.panes_add(pane)
+				pane.panes_saved = (visible, ids)
+				for i in ids:
+					self.panes_restoring[i] = pane
+			self.current_pane = self.panes_list[current]
+
+			self.panes_tree = None
+			if tree is not None:
+				try:
+					self.panes_tree = SplitTree(persist.build_tree(tree, self.panes_list))
+				except (StopIteration, IndexError, ValueError):
+					tracing.debug('panesScreen', 'Ignoring broken saved split tree')
+			self.panes_workspaces[n] = (self.panes_list, self.panes_tree,
+				self.panes_graph, self.current_pane)
+		self.panes_workspace = workspace
+		self.panes_list, self.panes_tree, self.panes_graph, self.current_pane = \
+			self.panes_workspaces.pop(workspace)
+		self.panes_begin()
+
+	def panes_restore_done(self):
+		"Put restored windows back in their old order and focus once."
+
+		self.panes_restoring = None
+		panes = list(self.panes_list)
+		for saved in self.panes_workspaces.values():
+			panes.extend(saved[0])
+		for pane in panes:
+			visible, ids = pane.panes_saved
+			del pane.panes_saved
+			order = {}
+			for i, wid in enumerate(ids):
+				order[wid] = i
+			windows = list(pane.window_list)
+			# Windows we know nothing about go after the restored ones.
+			windows.sort(lambda a, b: cmp(order.get(a.window.id, len(ids)),
+									order.get(b.window.id, len(ids))))
+			pane.window_list = WindowList()
+			for w in windows:
+				pane.window_list.append(w)
+			if 0 <= visible < len(ids) and ids[visible] in order:
+				for w in windows:
+					if w.window.id == ids[visible]:
+						pane.window = w
+			if pane.window is None:
+				pane.window = pane.window_list.first
+			if pane.workspace == self.panes_workspace:
+				pane.hide_others()
+			else:
+				for w in pane.window_list:
+					self.panes_show(w, 0)
+		try:
+			self.current_pane.activate()
+		finally:
+			self.panes_commit()
 
 	def panes_fullscreen(self, pane):
 		"Make the pane use the all the available screen."
@@ -73,33 +225,444 @@ class panesScreen:
 		pane.height = self.root_height
 		pane.y = 0
 
+	def panes_screen_change(self, event):
+		"RandR says the screen has a new size."
+
+		width, height = event.width_in_pixels, event.height_in_pixels
+		# The size is the unrotated one, like XRRUpdateConfiguration has it.
+		if event.rotation & (randr.Rotate_90 | randr.Rotate_270):
+			width, height = height, width
+		eventlog.record('randr', self.number, 0, width, height)
+		self.panes_root_resized(width, height)
+
+	def panes_root_configure(self, event):
+		"The root window changed, maybe its size, when there's no RandR."
+
+		if event.window.id != self.root.id:
+			return
+		eventlog.record('randr', self.number, 0, event.width, event.height)
+		self.panes_root_resized(event.width, event.height)
+
+	def panes_root_resized(self, width, height):
+		"""Fit the panes of every workspace to a root of a new size.
+
+		Panes keep their share of the screen. Where there's a split tree
+		it lays them out again, otherwise every edge is scaled the same
+		way, so edges that met still meet and no pixel is left out or
+		counted twice. The windows all get reconfigured in one batch."""
+
+		old_width, old_height = self.root_width, self.root_height
+		if (width, height) == (old_width, old_height):
+			return
+		tracing.record('root-resized', width, height)
+		self.panes_begin()
+		try:
+			zoomed = self.panes_zoomed
+			self.panes_unzoom()
+			self.root_width, self.root_height = width, height
+			for panes, tree, graph, current in self.panes_layouts().values():
+				if tree is not None:
+					rects = tree.layout(tree.root, 0, 0, width, height, {})
+				else:
+					rects = {}
+					for p in panes:
+						x, y = p.x * width / old_width, p.y * height / old_height
+						rects[p] = (x, y,
+							(p.x + p.width) * width / old_width - x,
+							(p.y + p.height) * height / old_height - y)
+				for p, (x, y, w, h) in rects.items():
+					p.x, p.y, p.width, p.height = x, y, w, h
+					graph.touch(p)
+					p.replace_all()
+			if zoomed is not None:
+				self.panes_zoom(zoomed[0])
+			self.panes_refocus()
+		finally:
+			self.panes_commit()
+
 	def panes_configure(self, event):
-		"A window changed, so pass it on to my pane."
+		"""A window wants to change, so pass it on to my pane.
+
+		Clients tend to send these in bursts, so they are only collected
+		here, and acted on by panes_configure_flush once every queued
+		event has been handled. Only the last one for a window counts."""
 
+		eventlog.record('configure', self.number, event.window.id, event.x,
+			event.y, event.width, event.height,
+			event.value_mask | event.stack_mode << 16)
 		w = self.get_window(event.window)
-		if w and w.pane:
-			if event.value_mask & (X.CWX | X.CWY | X.CWWidth | X.CWHeight):
-				w.pane.place_window(w)
-			if event.value_mask & X.CWStackMode and event.stack_mode == X.Above \
-				and self.allow_self_changes(w):
-				w.pane.add_window(w)
+		if not w or not w.pane:
+			return
+		mask = event.value_mask & (X.CWX | X.CWY | X.CWWidth | X.CWHeight)
+		if mask:
+			now = time.time()
+			if now - w.panes_configure_since > self.panes_configure_period:
+				w.panes_configure_since = now
+				w.panes_configure_count = 0
+			w.panes_configure_count += 1
+			if w.panes_configure_count > self.panes_configure_limit:
+				tracing.debug('panesScreen', 'Ignoring configure flood from %s', w)
+				mask = 0
+		if event.value_mask & X.CWStackMode and event.stack_mode == X.Above \
+			and self.allow_self_changes(w):
+			mask = mask | X.CWStackMode
+		if mask:
+			self.panes_configures[w] = self.panes_configures.get(w, 0) | mask
+		if not self.wm.display.pending_events():
+			self.panes_configure_flush()
+
+	def panes_configure_flush(self):
+		"""Answer the configure requests collected by panes_configure.
+
+		A window that would stay where it is just gets told so with a
+		synthetic ConfigureNotify, without being reconfigured."""
+
+		if not self.panes_configures:
+			return
+		configures, self.panes_configures = self.panes_configures, {}
+		self.panes_begin()
+		try:
+			for w, mask in configures.items():
+				if not w.pane or w.withdrawn:
+					continue
+				if mask & (X.CWX | X.CWY | X.CWWidth | X.CWHeight):
+					geometry = w.pane.window_geometry(w)
+					if self.panes_pending.get(w, w.panes_geometry) == geometry:
+						self.panes_configure_notify(w, geometry)
+					else:
+						w.pane.place_window(w)
+				if mask & X.CWStackMode:
+					w.pane.add_window(w)
+		finally:
+			self.panes_commit()
+
+	def panes_configure_notify(self, window, geometry):
+		"Tell window it has geometry, as ICCCM says to for refused requests."
+
+		x, y, width, height = geometry
+		window.window.send_event(xevent.ConfigureNotify(
+			window = window.window, event = window.window,
+			above_sibling = X.NONE, x = x, y = y, width = width,
+			height = height, border_width = window.border_width,
+			override = 0), event_mask = X.StructureNotifyMask)
+
+	def panes_begin(self):
+		"""Start batching window geometry changes.
+
+		Until the matching panes_commit, placing windows only records where
+		they should go, and activating a pane doesn't touch X. Batches
+		nest; only the outermost commit talks to the server."""
+
+		self.panes_batch += 1
+
+	def panes_commit(self):
+		"""Finish a batch started by panes_begin.
+
+		Every window whose final geometry differs from what we last gave it
+		gets exactly one moveresize, windows are shown or hidden, then the
+		current pane gets the focus if any pane was activated, and it all
+		goes out in one flush."""
+
+		self.panes_batch -= 1
+		if self.panes_batch:
+			return
+		pending, self.panes_pending = self.panes_pending, {}
+		shown, self.panes_pending_shown = self.panes_pending_shown, {}
+		focus, self.panes_pending_focus = self.panes_pending_focus, None
+
+		# Windows coming back get their geometry before they're mapped.
+		for window, show in shown.items():
+			if show and window.panes_hidden and window.pane is not None:
+				pending[window] = window.pane.window_geometry(window)
+		for window, geometry in pending.items():
+			if window.panes_geometry != geometry:
+				self.panes_moveresize(window, geometry)
+		mapped = {}
+		for window, show in shown.items():
+			if window.withdrawn or window.pane is None:
+				continue
+			if show and window.panes_hidden:
+				window.panes_hidden = 0
+				window.deiconify()
+				mapped[window.pane] = 1
+			elif not show and not window.panes_hidden:
+				window.panes_hidden = 1
+				window.panes_unmaps += 1
+				window.iconify()
+		# The windows came back in no particular order. Unless only the
+		# shown ones did, those have to be put on top of the others.
+		if not self.panes_iconify_hidden:
+			for pane in mapped.keys():
+				if pane.window is not None and not pane.window.panes_hidden:
+					pane.window.raisewindow()
+		# Whatever is current by now, panes_remove may have changed it
+		# without activating anything.
+		if focus is not None:
+			self.current_pane.focus()
+		self.wm.display.flush()
+
+	def panes_focus_flush(self):
+		"Give the focus to the current pane, if activating it was put off."
+
+		if self.panes_batch or self.panes_pending_focus is None:
+			return
+		self.panes_pending_focus = None
+		self.current_pane.focus()
+		self.wm.display.flush()
+
+	def panes_refocus(self):
+		"""The current pane moved; have the outline follow it.
+
+		On the screen with the focus, the pane is focused again when the
+		batch is done. Other screens only get their outline moved, so
+		the focus isn't taken away from where it is."""
+
+		if self.wm.current_screen is self:
+			self.panes_pending_focus = self.current_pane
+			return
+		event = paneFocus()
+		event.pane = self.current_pane
+		self.wm.misc_dispatch.dispatch_event(event)
+
+	def panes_show(self, window, show = 1):
+		"""Show a window, or hide it if show is false.
+
+		Hidden windows are iconified, and not resized with their pane
+		until they're shown again."""
+
+		self.panes_begin()
+		self.panes_pending_shown[window] = show
+		self.panes_commit()
+
+	def panes_moveresize(self, window, geometry):
+		"Give a window its geometry, or queue it while batching."
+
+		if self.panes_batch:
+			self.panes_pending[window] = geometry
+		else:
+			window.panes_geometry = geometry
+			window.moveresize(*geometry)
+
+	def panes_zoom(self, pane):
+		"""Let pane fill the screen, putting the rest of the layout away.
+
+		The other panes keep their geometry and windows, they're just out
+		of panes_list until panes_unzoom brings them back, so only the
+		window pane shows gets reconfigured."""
+
+		if self.panes_zoomed is not None or len(self.panes_list) < 2:
+			return
+		tracing.record('zoom', pane.x, pane.y, pane.width, pane.height)
+		self.panes_zoomed = (pane, (pane.x, pane.y, pane.width, pane.height),
+			self.panes_list, self.panes_tree, self.panes_graph)
+		self.panes_begin()
+		try:
+			self.panes_list = [pane]
+			self.panes_graph = PaneGraph()
+			self.panes_graph.add(pane)
+			self.panes_tree = SplitTree(pane)
+			self.panes_fullscreen(pane)
+			pane.place_window()
+			pane.activate()
+		finally:
+			self.panes_commit()
+
+	def panes_unzoom(self):
+		"""Put back the layout panes_zoom put away.
+
+		Only the zoomed pane moved, so only its windows that aren't where
+		they belong any more get reconfigured."""
+
+		if self.panes_zoomed is None:
+			return
+		pane, (x, y, width, height), panes, tree, graph = self.panes_zoomed
+		self.panes_zoomed = None
+		tracing.record('unzoom', x, y, width, height)
+		self.panes_begin()
+		try:
+			self.panes_list, self.panes_tree, self.panes_graph = panes, tree, graph
+			pane.x, pane.y, pane.width, pane.height = x, y, width, height
+			pane.replace_all()
+			self.panes_refocus()
+		finally:
+			self.panes_commit()
+
+	def panes_layouts(self):
+		"""Return the layouts of all workspaces, the one on show included.
+
+		It's a dictionary of workspace numbers to (panes_list, panes_tree,
+		panes_graph, current_pane)."""
+
+		layouts = self.panes_workspaces.copy()
+		layouts[self.panes_workspace] = (self.panes_list, self.panes_tree,
+			self.panes_graph, self.current_pane)
+		return layouts
+
+	def panes_new_layout(self, workspace):
+		"Return a layout for workspace with one pane filling the screen."
+
+		pane = Pane(self, 0, 0, self.root_width, self.root_height)
+		pane.workspace = workspace
+		graph = PaneGraph()
+		graph.add(pane)
+		return [pane], SplitTree(pane), graph, pane
+
+	def panes_switch_workspace(self, workspace):
+		"""Show workspace instead of the current one.
+
+		The old workspace's windows are iconified and the new one's
+		mapped in one batch, with the server grabbed so nothing is seen
+		half done. Windows get reconfigured only if their pane changed
+		since they were last on show. A new workspace starts out with one
+		pane."""
+
+		if workspace == self.panes_workspace:
+			return
+		tracing.record('workspace', self.panes_workspace, workspace)
+		self.wm.display.grab_server()
+		try:
+			self.panes_begin()
+			try:
+				panes = self.panes_list
+				if self.panes_zoomed is not None:
+					panes = self.panes_zoomed[2]
+				for pane in panes:
+					for window in pane.window_list:
+						self.panes_show(window, 0)
+				# Leaving puts back whatever zoom put away. The windows are
+				# on their way out, so none of them get moved for it.
+				self.panes_unzoom()
+				self.panes_workspaces[self.panes_workspace] = (self.panes_list,
+					self.panes_tree, self.panes_graph, self.current_pane)
+
+				saved = self.panes_workspaces.pop(workspace, None)
+				if saved is None:
+					saved = self.panes_new_layout(workspace)
+				self.panes_workspace = workspace
+				self.panes_list, self.panes_tree, self.panes_graph, \
+					self.current_pane = saved
+				for pane in self.panes_list:
+					for window in pane.window_list:
+						if window is pane.window or not self.panes_iconify_hidden:
+							self.panes_show(window)
+				self.current_pane.activate()
+			finally:
+				self.panes_commit()
+		finally:
+			self.wm.display.ungrab_server()
+			self.wm.display.flush()
+
+	def panes_send_window(self, window, workspace):
+		"Move window to the current pane of another workspace."
+
+		if workspace == self.panes_workspace or window.pane is None:
+			return
+		tracing.record('send', window.window.id, workspace)
+		saved = self.panes_workspaces.get(workspace)
+		if saved is None:
+			saved = self.panes_workspaces[workspace] = \
+				self.panes_new_layout(workspace)
+		pane = saved[3]
+		self.panes_begin()
+		try:
+			window.pane.remove_window(window)
+			pane.window_list.append(window)
+			window.pane = pane
+			pane.set_window(window)
+			self.panes_show(window, 0)
+		finally:
+			self.panes_commit()
 
 	#####
 	def panes_add(self, pane):
 		"Add the given pane to the list of all panes."
 
-		wmanager.debug('panesManager', 'added pane %s', `pane`)
+		tracing.debug('panesManager', 'added pane %r', pane)
 		self.panes_list.append(pane)
+		self.panes_graph.add(pane)
 		if self.current_pane is None: self.current_pane = self.panes_list[0]
 
 	def panes_remove(self, test):
 		"Remove panes that match the filter."
 
 		old = self.current_pane
+		for pane in filter(test, self.panes_list):
+			self.panes_graph.remove(pane)
+			if self.panes_tree is not None and pane in self.panes_tree:
+				self.panes_tree.remove(pane)
 		self.panes_list = filter(cfilter.Not(test), self.panes_list)
 		try: self.panes_list.index(old)
 		except ValueError: self.current_pane = self.panes_list[0]
 
+	def panes_apply_layout(self, template, policy = 'spread'):
+		"""Replace all panes with the layout template, in one go.
+
+		template is a layout.templates name or a template itself. The
+		windows are handed out to the new panes by policy: 'spread' gives
+		every pane one of the windows that were showing, starting with
+		the current pane's, and deals out the rest in turn; 'stack' puts
+		them all in the first pane. The pane that gets the focused window
+		ends up current."""
+
+		if isinstance(template, str):
+			template = layout.templates[template]
+		if policy not in ('spread', 'stack'):
+			raise ValueError, 'no such window policy: %s' % policy
+		tracing.debug('panesScreen', 'Applying layout %r', template)
+
+		self.panes_unzoom()
+		old = list(self.panes_list)
+		if self.current_pane in old:
+			old.remove(self.current_pane)
+			old.insert(0, self.current_pane)
+		focused = self.current_pane and self.current_pane.window
+		shown = [p.window for p in old if p.window is not None]
+		windows = shown + [w for p in old for w in p.window_list
+							if w is not p.window]
+
+		new = []
+		def new_pane():
+			new.append(Pane(self, 0, 0, 0, 0))
+			return new[-1]
+		tree = SplitTree(layout.build(template, new_pane))
+
+		self.panes_begin()
+		try:
+			for p in old:
+				p.window_list = WindowList()
+				p.window = None
+			for pane, (x, y, width, height) in tree.layout(tree.root,
+					0, 0, self.root_width, self.root_height, {}).items():
+				pane.x, pane.y, pane.width, pane.height = x, y, width, height
+			self.panes_list = []
+			self.panes_graph = PaneGraph()
+			self.current_pane = None
+			for pane in new:
+				self.panes_add(pane)
+			self.panes_tree = tree
+
+			if policy == 'stack':
+				targets = new[:1] * len(windows)
+			else:
+				targets = [new[i % len(new)] for i in range(len(windows))]
+			for window, pane in zip(windows, targets):
+				pane.window_list.append(window)
+				window.pane = pane
+			for i, pane in enumerate(new):
+				if i < len(shown) and policy == 'spread':
+					pane.set_window(shown[i])
+				else:
+					pane.set_window(pane.window_list.first)
+				pane.hide_others()
+				pane.replace_all()
+
+			current = new[0]
+			if focused is not None and focused.pane is not None:
+				current = focused.pane
+			current.activate()
+		finally:
+			self.panes_commit()
+
 
 class panesClient:
 	"""panesClient - pane mixin for clients
@@ -107,12 +670,24 @@ class panesClient:
 	Note that this needs to be mixed in *after* any mixins that affect window
 	geometry, such as border."""
 
+	# The (x, y, width, height) we last asked the window to take.
+	panes_geometry = None
+	# Iconified by panes_show, see panes_iconify_hidden.
+	panes_hidden = 0
+	# How many UnmapNotifies our iconifying has still got coming. They
+	# can turn up after the window's been shown again.
+	panes_unmaps = 0
+	# When the current configure rate limiting period started, and how
+	# many geometry requests the window made in it.
+	panes_configure_since = 0.0
+	panes_configure_count = 0
+
 	def __client_init__(self):
 		"Arrange to open in the current pane."
 
-		wmanager.debug('Pane', 'Initing client %s', self)
+		tracing.debug('Pane', 'Initing client %s', self)
 		# Set this clients gravity
-		if self.window.get_property(WM_TRANSIENT_FOR, Xatom.WINDOW, 0, 1) is not None:
+		if self.panes_transient():
 			self.panes_gravity = self.screen.panes_transient_gravity
 		elif self.sizehints and self.sizehints.flags & Xutil.PMaxSize:
 			self.panes_gravity = self.screen.panes_maxsize_gravity
@@ -120,19 +695,83 @@ class panesClient:
 			self.panes_gravity = self.screen.panes_window_gravity
 
 		self.pane = None
-		pane = self.screen.current_pane
-		if pane.screen != self.screen:
-			pane = filter(lambda p, m=self.screen: p.screen == m, self.screen.panes_list)[0]
-		pane.add_window(self)
-		self.dispatch.add_handler(X.UnmapNotify, self.panes_unmap)
-		self.dispatch.add_handler(X.DestroyNotify, self.panes_unmap)
+		eventlog.record('map', self.screen.number, self.window.id, self.x, self.y,
+			self.width, self.height)
+		# Whatever geometry the window has now, we don't need to send again.
+		self.panes_geometry = (self.x, self.y, self.width, self.height)
+		restoring = self.screen.panes_restoring
+		if restoring is not None and restoring.has_key(self.window.id):
+			restoring[self.window.id].restore_window(self)
+		else:
+			pane = self.screen.current_pane
+			if pane.screen != self.screen:
+				pane = filter(lambda p, m=self.screen: p.screen == m, self.screen.panes_list)[0]
+			pane.add_window(self)
+		unmap = stats.timed('panes_unmap', self.panes_unmap)
+		self.dispatch.add_handler(X.UnmapNotify, unmap)
+		self.dispatch.add_handler(X.DestroyNotify, unmap)
+		self.dispatch.add_handler(X.PropertyNotify,
+			self.screen.panes_props.property_notify)
+
+	def panes_transient(self):
+		"Is this a transient window?"
+
+		self.screen.panes_prefetched.discard(self.window.id)
+		return self.screen.panes_props.get(self.window, 'WM_TRANSIENT_FOR',
+											Xatom.WINDOW) is not None
 
 	def panes_unmap(self, event):
 		"The window is going away or gone - make sure it's not taking up a pane"
 
+		if event.type == X.UnmapNotify:
+			eventlog.record('unmap', self.screen.number, self.window.id,
+				event.send_event, self.panes_unmaps)
+		else:
+			eventlog.record('destroy', self.screen.number, self.window.id)
+		# Hiding the window unmapped it, that doesn't count, even if it's
+		# been shown again since. Withdrawing from iconic state is done
+		# with a synthetic UnmapNotify.
+		if event.type == X.UnmapNotify and self.panes_unmaps \
+			and not event.send_event:
+			self.panes_unmaps -= 1
+			return
+		# Nobody tells us about property changes of withdrawn windows.
+		self.screen.panes_props.forget(self.window)
 		if self.pane: self.pane.remove_window(self)
 
 
+class panesManager:
+	"""panesManager - WindowManager mixin for deferred pane work.
+
+	Runs whatever the screens put off until the event queue is empty.
+	Queued resizes are also done before any event other than the repeat
+	of their key, so they happen in the order they were asked for.
+	Has to come before wmanager.WindowManager in the bases."""
+
+	def handle_event(self, event, *args, **kwargs):
+		for s in self.screens:
+			resize.flush_resizes(s, event)
+		try:
+			return wmanager.WindowManager.handle_event(self, event, *args, **kwargs)
+		finally:
+			if not self.display.pending_events():
+				eventlog.record('idle')
+				self.panes_idle()
+
+	def panes_idle(self):
+		"Do what the screens put off until there are no events queued."
+
+		for s in self.screens:
+			s.panes_configure_flush()
+			resize.flush_resizes(s)
+		# The current screen last, so it ends up with the focus.
+		for s in self.screens:
+			if s is not self.current_screen:
+				s.panes_focus_flush()
+		if self.current_screen is not None:
+			self.current_screen.panes_focus_flush()
+
+
 class Pane:
 	"Pane - the object(s) that manages windows on the screen."
 
@@ -141,15 +780,17 @@ class Pane:
 
 		self.screen, self.x, self.y, self.width, self.height = screen, x, y, width, height
 		self.wm = screen.wm
+		self.workspace = screen.panes_workspace
 		self.window = None
-		self.window_list = []
+		self.window_list = WindowList()
 
 	def add_window(self, window):
 		"Add a window to this pane."
 
 		if window in self.window_list:
 			return
-		wmanager.debug('Pane', 'Adding window %s to pane %s', window, self)
+		tracing.debug('Pane', 'Adding window %s to pane %s', window, self)
+		tracing.record('add', window.window.id, self.x, self.y)
 
 		self.window_list.append(window)
 		prev_pane = window.pane
@@ -158,52 +799,96 @@ class Pane:
 				prev_pane.remove_window(window)
 			self.place_window(window)
 			window.pane = self
-		self.window = window
+		self.set_window(window)
 		self.activate()
 
+	def set_window(self, window):
+		"Make window the one this pane shows."
+
+		old, self.window = self.window, window
+		if self.workspace != self.screen.panes_workspace:
+			# Everything is hidden there, it gets sorted out on the switch.
+			return
+		zoomed = self.screen.panes_zoomed
+		if window is not None and zoomed is not None and zoomed[0] is self:
+			# Zooming only fitted the window shown then.
+			self.place_window(window)
+		if not self.screen.panes_iconify_hidden:
+			return
+		if old is not None and old is not window and old.pane is self:
+			self.screen.panes_show(old, 0)
+		if window is not None:
+			self.screen.panes_show(window)
+
+	def hide_others(self):
+		"Hide every window but the one shown, if the screen wants that."
+
+		if not self.screen.panes_iconify_hidden:
+			return
+		self.screen.panes_begin()
+		try:
+			for window in self.window_list:
+				if window is not self.window:
+					self.screen.panes_show(window, 0)
+		finally:
+			self.screen.panes_commit()
+
+	def restore_window(self, window):
+		"Take back a window that was ours before a restart, quietly."
+
+		self.window_list.append(window)
+		window.pane = self
+		self.place_window(window)
+
 	def remove_window(self, window):
 		"Disown a window and cycle a new one into focus."
 
 		if window.pane != self or window not in self.window_list:
 			return
-		wmanager.debug('Pane', 'Removing window %s from pane %s' % (window, self))
+		tracing.debug('Pane', 'Removing window %s from pane %s', window, self)
+		tracing.record('remove', window.window.id, self.x, self.y)
 		window.pane = None
-		windex = self.window_list.index(window)
+		prev = self.window_list.before(window)
 		self.window_list.remove(window)
 		if self.window == window:
 			# Jump back towards the beginning of the window list.
-			if windex > 0:
-				windex -= 1
-			elif self.window_list != []:
-				windex = 0
-			else:
+			if prev is None:
+				prev = self.window_list.first
+			if prev is None:
 				self.window = None
 				if self.screen.current_pane == self:
 					self.wm.set_current_client(None)
 				return
 
-			self.window = self.window_list[windex]
+			self.set_window(prev)
 			if self.screen.current_pane == self:
 				self.activate()
 
+	def window_geometry(self, window):
+		"Return the (x, y, width, height) window should have in this pane."
+
+		# Bypassing size hints/gravity, they seem useless for tiles.
+		width = self.width - 2 * window.border_width
+		height = self.height - 2 * window.border_width
+		return window.keep_on_screen(self.x, self.y, width, height)
+
 	def place_window(self, window = None):
 		"Figure out where the window should be put."
 
 		if window is None:
 			window = self.window
-		if window is None:
+		# Hidden windows are placed when they're shown.
+		if window is None or window.panes_hidden or \
+			self.screen.panes_pending_shown.get(window) == 0:
 			return
-		wmanager.debug('Pane', 'Placing window %s for pane %s' % (window, self))
+		tracing.debug('Pane', 'Placing window %s for pane %s', window, self)
 
-		# Bypassing size hints/gravity, they seem useless for tiles.
-		width = self.width - 2 * window.border_width
-		height = self.height - 2 * window.border_width
-		x, y = self.x, self.y
-		x, y, width, height = window.keep_on_screen(x, y, width, height)
+		x, y, width, height = self.window_geometry(window)
 
-		wmanager.debug('Pane-configure', 'Resizing window from %d, %d to %d, %d' %
-						(window.width, window.height, width, height))
-		window.moveresize(x, y, width, height)
+		tracing.debug('Pane-configure', 'Resizing window from %d, %d to %d, %d',
+						window.width, window.height, width, height)
+		tracing.record('place', window.window.id, x, y, width, height)
+		self.screen.panes_moveresize(window, (x, y, width, height))
 
 	def force_window(self):
 		"Try and force an application to notice what size it's window is."
@@ -218,22 +903,42 @@ class Pane:
 		"A place to do anything appropriate for us when losing the focus."
 
 		if self.window and not self.window.withdrawn:
-			if self.screen.current_pane == self:
-				self.wm.set_current_client(None)
+			self.wm.set_current_client(None)
 		event = paneBlur()
 		event.pane = self
 		self.wm.misc_dispatch.dispatch_event(event)
 
 	def activate(self):
-		"Activate whatever is currently my window."
+		"""Activate whatever is currently my window.
 
+		We're the current pane from here on, but while batching or while
+		there are events waiting, telling X and everybody else about it
+		is left for when that's over, so only the last of a quick run of
+		activations costs anything."""
+
+		zoomed = self.screen.panes_zoomed
+		if zoomed is not None and zoomed[0] is not self:
+			# We're put away, get the layout back.
+			self.screen.panes_unzoom()
 		self.wm.current_screen = self.screen
-		if self.screen.current_pane != self:
-			self.screen.current_pane.deactivate()
-			self.screen.current_pane = self
+		self.screen.current_pane = self
+		if self.screen.panes_batch or self.wm.display.pending_events():
+			self.screen.panes_pending_focus = self
+			return
+		self.focus()
+
+	def focus(self):
+		"Give my window the X focus and tell everyone I'm focused."
+
+		old = self.screen.panes_focused
+		self.screen.panes_focused = self
+		if old is not None and old is not self:
+			old.deactivate()
+		tracing.record('focus', self.window and self.window.window.id or 0,
+			self.x, self.y, self.width, self.height)
 		if self.window and not self.window.withdrawn:
-			wmanager.debug('Pane', 'Activating window %s in pane %s' %
-							(self.window, self))
+			tracing.debug('Pane', 'Activating window %s in pane %s',
+							self.window, self)
 			self.window.activate()
 			self.window.warppointer()
 		event = paneFocus()
@@ -246,13 +951,22 @@ class Pane:
 		if not 0 < frac < 1:
 			raise ValueError, "Pane splits must be between 0 and 1."
 
-		new_height = int(self.height * frac)
-		self.height = self.height - new_height
-		new_y = self.y + self.height
-		self.replace_all()
-		new_pane = Pane(self.screen, self.x, new_y, self.width, new_height)
-		self.screen.panes_add(new_pane)
-		new_pane.activate()
+		self.screen.panes_unzoom()
+		self.screen.panes_begin()
+		try:
+			new_height = int(self.height * frac)
+			self.height = self.height - new_height
+			new_y = self.y + self.height
+			self.screen.panes_graph.touch(self)
+			self.replace_all()
+			new_pane = Pane(self.screen, self.x, new_y, self.width, new_height)
+			tracing.record('hsplit', self.x, new_y, self.width, new_height)
+			self.screen.panes_add(new_pane)
+			if self.screen.panes_tree is not None:
+				self.screen.panes_tree.split(self, new_pane, 0)
+			new_pane.activate()
+		finally:
+			self.screen.panes_commit()
 
 	def vertical_split(self, frac = .5):
 		"Split the pane vertically, taking frac off the right."
@@ -260,36 +974,195 @@ class Pane:
 		if not 0 < frac < 1:
 			raise ValueError, "Pane splits must be between 0 and 1."
 
-		new_width = int(self.width * frac)
-		self.width = self.width - new_width
-		new_x = self.x + self.width
-		self.replace_all()
-		new_pane = Pane(self.screen, new_x, self.y, new_width, self.height)
-		self.screen.panes_add(new_pane)
-		new_pane.activate()
+		self.screen.panes_unzoom()
+		self.screen.panes_begin()
+		try:
+			new_width = int(self.width * frac)
+			self.width = self.width - new_width
+			new_x = self.x + self.width
+			self.screen.panes_graph.touch(self)
+			self.replace_all()
+			new_pane = Pane(self.screen, new_x, self.y, new_width, self.height)
+			tracing.record('vsplit', new_x, self.y, new_width, self.height)
+			self.screen.panes_add(new_pane)
+			if self.screen.panes_tree is not None:
+				self.screen.panes_tree.split(self, new_pane, 1)
+			new_pane.activate()
+		finally:
+			self.screen.panes_commit()
+
+	def remove(self):
+		"""Close this pane, handing its space and windows to neighbors.
+
+		If we came from a split, our sibling in the split tree takes over
+		the area of the split. Otherwise the panes on one side of us that
+		share exactly that edge grow over it. Only those panes move.
+		Returns false if there's nobody to take over."""
+
+		s = self.screen
+		s.panes_unzoom()
+		if len(s.panes_list) < 2:
+			return 0
+		tree = s.panes_tree
+		if tree is not None and self in tree:
+			rects = self.__sibling_rects(tree)
+		else:
+			rects = self.__edge_rects()
+		if not rects:
+			return 0
+
+		# Our windows go to whoever shared the longest edge with us, the
+		# topmost, then leftmost of them on a tie: neighbors come in no
+		# particular order.
+		best = None
+		for dir in ('left', 'up', 'right', 'down'):
+			for p in s.panes_graph.neighbors(self, dir):
+				if p in rects:
+					key = (self.__shared(p, dir), -p.y, -p.x)
+					if best is None or key > best[0]:
+						best = key, p
+		target = best[1]
+
+		tracing.record('remove-pane', self.x, self.y, self.width, self.height)
+		current = s.current_pane is self
+		# Whoever grows over us ends up next to our old neighbors, which
+		# the graph can only find from us before we're gone.
+		around = []
+		for dir in ('left', 'up', 'right', 'down'):
+			around.extend(s.panes_graph.neighbors(self, dir))
+		for p in around:
+			s.panes_graph.touch(p)
+		s.panes_begin()
+		try:
+			if tree is not None and self in tree:
+				tree.remove(self)
+			s.panes_remove(lambda p, m = self: p is m)
+			for pane, (x, y, width, height) in rects.items():
+				if (pane.x, pane.y, pane.width, pane.height) != (x, y, width, height):
+					pane.x, pane.y, pane.width, pane.height = x, y, width, height
+					s.panes_graph.touch(pane)
+					pane.replace_all()
+			for window in self.window_list:
+				target.window_list.append(window)
+				window.pane = target
+				target.place_window(window)
+			if target.window is None:
+				target.set_window(self.window or target.window_list.first)
+			target.hide_others()
+			self.window_list = WindowList()
+			self.window = None
+			if current:
+				target.activate()
+		finally:
+			s.panes_commit()
+		return 1
+
+	def __sibling_rects(self, tree):
+		"Where the panes under our sibling go when it takes our place."
+
+		parent = tree.parents[self]
+		if parent is None:
+			return None
+		if parent.first is self:
+			sibling = parent.second
+		else:
+			sibling = parent.first
+		t, r, b, l = tree.get_edges(parent)
+		return tree.layout(sibling, l, t, r - l, b - t, {})
+
+	def __edge_rects(self):
+		"Where the panes sharing exactly one of our edges go if they grow over us."
+
+		t, r, b, l = self.get_edges()
+		for dir in ('left', 'up', 'right', 'down'):
+			others = self.screen.panes_graph.neighbors(self, dir)
+			if not others:
+				continue
+			if dir in ('left', 'right'):
+				spans = [(o.y, o.y + o.height) for o in others]
+				start, end = t, b
+			else:
+				spans = [(o.x, o.x + o.width) for o in others]
+				start, end = l, r
+			spans.sort()
+			# They have to cover the edge from end to end, and no more.
+			pos = start
+			for a, z in spans:
+				if a != pos:
+					break
+				pos = z
+			if pos != end:
+				continue
+
+			rects = {}
+			for o in others:
+				if dir == 'left':
+					rects[o] = (o.x, o.y, o.width + self.width, o.height)
+				elif dir == 'right':
+					rects[o] = (self.x, o.y, o.width + self.width, o.height)
+				elif dir == 'up':
+					rects[o] = (o.x, o.y, o.width, o.height + self.height)
+				else:
+					rects[o] = (o.x, self.y, o.width, o.height + self.height)
+			return rects
+		return None
+
+	def __shared(self, other, dir):
+		"How long the edge we share with other on side dir is."
+
+		if dir in ('left', 'right'):
+			return min(self.y + self.height, other.y + other.height) - max(self.y, other.y)
+		return min(self.x + self.width, other.x + other.width) - max(self.x, other.x)
 
 	def maximize(self):
 		"Make me the only pane on my screen."
 
-		self.screen.panes_remove(lambda x, s = self.screen, m = self:
-							x.screen == s and x != m)
-		self.screen.panes_fullscreen(self)
-		for window in self.screen.query_clients():
-			window.pane = self
-			self.place_window(window)
-		self.activate()
+		self.screen.panes_unzoom()
+		tracing.record('maximize', self.x, self.y, len(self.screen.panes_list))
+		self.screen.panes_begin()
+		try:
+			others = [p for p in self.screen.panes_list if p is not self]
+			self.screen.panes_remove(lambda x, s = self.screen, m = self:
+								x.screen == s and x != m)
+			self.screen.panes_fullscreen(self)
+			self.screen.panes_graph.touch(self)
+			self.screen.panes_tree = SplitTree(self)
+			# Every window on the screen lives in one of the panes, so take
+			# them over straight from their window lists.
+			for pane in others:
+				for window in pane.window_list:
+					self.window_list.append(window)
+					window.pane = self
+				pane.window_list = WindowList()
+				pane.window = None
+			if self.window is None:
+				self.set_window(self.window_list.first)
+			self.hide_others()
+			self.replace_all()
+			self.activate()
+		finally:
+			self.screen.panes_commit()
+
+	def zoom(self):
+		"Fill the screen with me, or put the other panes back if I do."
+
+		if self.screen.panes_zoomed is None:
+			self.screen.panes_zoom(self)
+		else:
+			self.screen.panes_unzoom()
 
 	def replace_all(self):
 		'''Replace every window in the pane.'''
-		map(self.place_window, self.screen.query_clients(panefilter(self)))
+		map(self.place_window, self.window_list)
 
 	def switch_window(self, index):
 		"Raise and focus a particular window owned by this pane."
 		if not 0 <= index < len(self.window_list):
 			return
-		if self.window and self.window_list.index(self.window) == index:
+		window = self.window_list[index]
+		if self.window is window:
 			return
-		self.window = self.window_list[index]
+		self.set_window(window)
 		self.activate()
 
 	__diff_filters = {
@@ -332,29 +1205,50 @@ class Pane:
 		"""Find the closest pane in the specified direction.
 
 		dir is either 'up', 'down', 'left' or 'right'.
-		We assume a perfectly tiled layout because it's a tiled wm...
-		You may get stuck if there are holes between tiles.
+		We assume a perfectly tiled layout because it's a tiled wm, so only
+		the panes sharing our edge are considered. If there's a hole next to
+		us we fall back to looking at every pane.
 		We currently do not wrap around the screen."""
 
 		edges = self.get_edges()
-		dfilter = partial(self.__diff_filters[dir], edges)
-		dsort = partial(self.__diff_orders[dir], edges)
+		best = self.__closest(dir, edges, self.screen.panes_graph.neighbors(self, dir))
+		if best is None and not self.on_screen_edge(dir):
+			best = self.__closest(dir, edges, self.screen.panes_list)
+		return best
 
+	def __closest(self, dir, edges, candidates):
+		"Pick the best pane in direction dir out of candidates."
+
+		dfilter = self.__diff_filters[dir]
+		dsort = self.__diff_orders[dir]
 		best = None
 		bestdiff = None
 
-		for p in self.screen.panes_list:
+		for p in candidates:
 			p_edges = p.get_edges()
-			if p is self or not dfilter(p_edges):
+			if p is self or not dfilter(edges, p_edges):
 				continue
 
-			p_diff = dsort(p_edges)
-			if (bestdiff is None or p_diff[0] < bestdiff[0] or
-					(p_diff[0] == bestdiff[0] and p_diff[1] < bestdiff[1])):
+			# Candidates come in no particular order, so ties go to the
+			# topmost, then leftmost.
+			p_diff = dsort(edges, p_edges) + (p_edges[0], p_edges[3])
+			if bestdiff is None or p_diff < bestdiff:
 				best = p
 				bestdiff = p_diff
 		return best
 
+	def on_screen_edge(self, dir):
+		"Is the dir side of this pane against the edge of the screen?"
+
+		t, r, b, l = self.get_edges()
+		if dir == 'up':
+			return t <= 0
+		if dir == 'down':
+			return b >= self.screen.root_height
+		if dir == 'left':
+			return l <= 0
+		return r >= self.screen.root_width
+
 	def move_window(self, dir):
 		"""Give the current window to another pane."""
 		neighbor = self.get_neighbor(dir)
@@ -363,6 +1257,77 @@ class Pane:
 			return
 		neighbor.add_window(self.window)
 
+class WindowList:
+	"""WindowList - the windows owned by a pane, in order.
+
+	This is the one place that says which windows are in which pane.
+	It iterates, indexes and len()s like a list, but membership tests,
+	appending and removing don't depend on how many windows it holds."""
+
+	def __init__(self):
+		self.links = {}		# window -> [previous, next]
+		self.first = self.last = None
+
+	def __len__(self):
+		return len(self.links)
+
+	def __contains__(self, window):
+		return window in self.links
+
+	def __iter__(self):
+		# Copy first, so callers can move windows around while iterating.
+		out = []
+		window = self.first
+		while window is not None:
+			out.append(window)
+			window = self.links[window][1]
+		return iter(out)
+
+	def __getitem__(self, index):
+		if index < 0:
+			index += len(self.links)
+		if not 0 <= index < len(self.links):
+			raise IndexError, "WindowList index out of range"
+		window = self.first
+		for _ in xrange(index):
+			window = self.links[window][1]
+		return window
+
+	def index(self, window):
+		for i, w in enumerate(self):
+			if w is window:
+				return i
+		raise ValueError, "window not in WindowList"
+
+	def append(self, window):
+		if window in self.links:
+			return
+		self.links[window] = [self.last, None]
+		if self.last is None:
+			self.first = window
+		else:
+			self.links[self.last][1] = window
+		self.last = window
+
+	def remove(self, window):
+		prev, next = self.links.pop(window)
+		if prev is None:
+			self.first = next
+		else:
+			self.links[prev][1] = next
+		if next is None:
+			self.last = prev
+		else:
+			self.links[next][0] = prev
+
+	def before(self, window):
+		"Return the window in front of window, or None."
+		return self.links[window][0]
+
+	def after(self, window):
+		"Return the window following window, or None."
+		return self.links[window][1]
+
 class panefilter:
 	"Filter for windows mapped in the current pane."
 	def __init__(self, pane):
@@ -382,55 +1347,109 @@ class paneBlur:
 class OutlinePane:
 	"""Draws a border around (within, rather) a pane.
 
-	We use four small windows to draw the edges of the border. Reparenting or
-	using normal border won't work because we won't always have a window to
-	draw around; we only deal with panes.
+	We use four small windows to draw the edges of the border, or a single
+	window with a hole cut out of it if the server has the SHAPE extension.
+	Reparenting or using normal border won't work because we won't always
+	have a window to draw around; we only deal with panes.
+
+	Only one pane per screen is outlined at a time, so each screen gets
+	its outline windows once and they're just moved around as the focus
+	changes. Losing the focus to another pane of the same screen leaves
+	them mapped; they're unmapped once the focus turns up on another
+	screen, or by outline_off.
 	"""
 	border_width = 1
 	group = 'Pane'
+	# Use a single shaped window when the server supports it.
+	use_shape = 1
 
 	def __init__(self, wm):
+		self.outlines = {}	# screen -> outline windows
+		self.shown = {}		# screen -> outlined pane
+		self.blurred = {}	# screen -> outlined pane that lost the focus
+		self.shaped = self.use_shape and shape is not None \
+			and wm.display.has_extension('SHAPE')
 		handlers = (
-			(self.outline_show, lambda e: isinstance(e, paneFocus), self.group),
-			(self.outline_hide, lambda e: isinstance(e, paneBlur), self.group),
+			(stats.timed('outline_show', self.outline_show),
+				lambda e: isinstance(e, paneFocus), self.group),
+			(stats.timed('outline_hide', self.outline_hide),
+				lambda e: isinstance(e, paneBlur), self.group),
 		)
 		for h in handlers:
 			wm.misc_dispatch.add_handler(*h)
 
-	def outline_show(self, event):
-		self.outline_hide(event)
-		pane = event.pane
-		pane.outline_windows = []
+	def outline_windows(self, screen):
+		"Return the outline windows of screen, creating them the first time."
 
-		# Grab 4 windows with no border, white background.
-		# TODO: Figure out how to do more colors.
-		for _ in range(4):
-			pane.outline_windows.append(pane.screen.root.create_window(
+		windows = self.outlines.get(screen)
+		if windows is None:
+			# Windows with no border, white background.
+			# TODO: Figure out how to do more colors.
+			count = self.shaped and 1 or 4
+			windows = [screen.root.create_window(
 				0, 0, 1, 1, 0, X.CopyFromParent,
-				background_pixel = pane.screen.info.white_pixel,
+				background_pixel = screen.info.white_pixel,
 				save_under = 1
-				))
+				) for _ in range(count)]
+			self.outlines[screen] = windows
+		return windows
+
+	def outline_show(self, event):
+		pane = event.pane
+		screen = pane.screen
+		windows = self.outline_windows(screen)
 
 		bw = self.border_width
 		edges = pane.get_edges()
 		width = edges[1] - edges[3]
 		height = edges[2] - edges[0]
 
-		# Resize windows.
-		pane.outline_windows[0].configure(x = edges[3], y = edges[0], width = width, height = bw) #t
-		pane.outline_windows[1].configure(x = edges[1] - bw, y = edges[0], width = bw, height = height) #r
-		pane.outline_windows[2].configure(x = edges[3], y = edges[2] - bw, width = width, height = bw) #b
-		pane.outline_windows[3].configure(x = edges[3], y = edges[0], width = bw, height = height) #l
-
-		for w in pane.outline_windows:
-			w.configure(stack_mode = X.Above)
-			w.map()
+		if self.shaped:
+			w = windows[0]
+			w.configure(x = edges[3], y = edges[0], width = width, height = height,
+						stack_mode = X.Above)
+			w.shape_rectangles(shape_set, shape_bounding, X.Unsorted, 0, 0, [
+				(0, 0, width, bw), #t
+				(width - bw, 0, bw, height), #r
+				(0, height - bw, width, bw), #b
+				(0, 0, bw, height), #l
+				])
+		else:
+			windows[0].configure(x = edges[3], y = edges[0], width = width, height = bw,
+						stack_mode = X.Above) #t
+			windows[1].configure(x = edges[1] - bw, y = edges[0], width = bw, height = height,
+						stack_mode = X.Above) #r
+			windows[2].configure(x = edges[3], y = edges[2] - bw, width = width, height = bw,
+						stack_mode = X.Above) #b
+			windows[3].configure(x = edges[3], y = edges[0], width = bw, height = height,
+						stack_mode = X.Above) #l
+
+		# The focus came from another screen, if some other screen's
+		# outline is still up for a pane that lost it.
+		for other in self.blurred.keys():
+			if other is not screen:
+				self.outline_off(other)
+		self.blurred.pop(screen, None)
+		if screen not in self.shown:
+			for w in windows:
+				w.map()
+		self.shown[screen] = pane
 
 	def outline_hide(self, event):
 		pane = event.pane
-		if not hasattr(pane, 'outline_windows') or pane.outline_windows is None:
+		screen = pane.screen
+		if self.shown.get(screen) is not pane:
 			return
-		for w in pane.outline_windows:
-			w.destroy()
-		pane.outline_windows = None
+		# Another pane of the screen is usually focused right after, so
+		# leave the outline up to be moved over there.
+		self.blurred[screen] = pane
+
+	def outline_off(self, screen):
+		"Take the outline of screen down."
 
+		self.blurred.pop(screen, None)
+		if screen not in self.shown:
+			return
+		for w in self.outlines[screen]:
+			w.unmap()
+		del self.shown[screen]
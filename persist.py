@@ -0,0 +1,167 @@
+#
+# persist.py -- Carry the pane layout across a restart.
+#
+#	Copyright (C) 2011  Jacob Courtneay <jacob@sporkexec.com>
+#
+#	This program is free software; you can redistribute it and/or modify
+#	it under the terms of the GNU General Public License as published by
+#	the Free Software Foundation; either version 2 of the License, or
+#	(at your option) any later version.
+#
+#	This program is distributed in the hope that it will be useful,
+#	but WITHOUT ANY WARRANTY; without even the implied warranty of
+#	MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#	GNU General Public License for more details.
+#
+#	You should have received a copy of the GNU General Public License
+#	along with this program; if not, write to the Free Software
+#	Foundation, Inc., 59 Temple Place, Suite 330, Boston, MA  02111-1307  USA
+
+"""Persist - save a screen's panes on its root window and read them back.
+
+The layout is kept as a short string property on the root window, so it
+survives an exec of the window manager but not the X server. It looks
+like this:
+
+	postmortwm 2 <root width> <root height> <current workspace>
+	W <workspace> <current pane>
+	T <split tree in prefix order, or ->
+	<x> <y> <width> <height> <visible> <window id> <window id> ...
+	...
+	W <workspace> <current pane>
+	...
+
+with a W line, a T line and one line per pane for every workspace.
+Split nodes in the tree are written as v or h followed by the ratio,
+then both children; leaves are pane numbers. <visible> is the position
+of the pane's current window in its list, or -1 if it has none.
+
+Version 1 had no workspaces: the current pane came at the end of the
+first line, followed by one workspace's T and pane lines."""
+
+from Xlib import Xatom
+from layout import Split
+import propcache
+
+version = 2
+atom_name = '_POSTMORTWM_LAYOUT'
+
+
+def encode(screen):
+	"""Describe the panes of every workspace of screen as a string.
+
+	A zoom isn't described, the layout it put away is."""
+
+	lines = ['postmortwm %d %d %d %d' % (version, screen.root_width,
+		screen.root_height, screen.panes_workspace)]
+	layouts = screen.panes_layouts()
+	rects = {}
+	if screen.panes_zoomed is not None:
+		pane, rects[pane], panes, tree, graph = screen.panes_zoomed
+		layouts[screen.panes_workspace] = (panes, tree, graph, pane)
+	numbers = layouts.keys()
+	numbers.sort()
+	for number in numbers:
+		panes, tree, graph, current = layouts[number]
+		index = {}
+		for i, p in enumerate(panes):
+			index[p] = i
+		lines.append('W %d %d' % (number, index.get(current, 0)))
+
+		if tree is None:
+			lines.append('T -')
+		else:
+			tokens = []
+			stack = [tree.root]
+			while stack:
+				n = stack.pop()
+				if isinstance(n, Split):
+					tokens.append('%s%r' % (n.vertical and 'v' or 'h', n.ratio))
+					stack.append(n.second)
+					stack.append(n.first)
+				else:
+					tokens.append(str(index[n]))
+			lines.append('T ' + ' '.join(tokens))
+
+		for p in panes:
+			ids = [w.window.id for w in p.window_list]
+			visible = -1
+			if p.window is not None and p.window in p.window_list:
+				visible = p.window_list.index(p.window)
+			x, y, width, height = rects.get(p, (p.x, p.y, p.width, p.height))
+			lines.append(' '.join(map(str, [x, y, width, height, visible] + ids)))
+	return '\n'.join(lines)
+
+def decode(data, width, height):
+	"""Parse what encode wrote for a screen of the given size.
+
+	Returns (workspace, layouts) or None if the data is no good for this
+	screen. layouts is a list of (workspace, current, tree, panes): tree
+	is a list of tokens as described above, or None; panes is a list of
+	((x, y, width, height), visible, window ids)."""
+
+	try:
+		lines = data.split('\n')
+		header = lines[0].split()
+		if header[0] != 'postmortwm' or int(header[1]) not in (1, version):
+			return None
+		if (int(header[2]), int(header[3])) != (width, height):
+			return None
+		if int(header[1]) == 1:
+			workspace = 0
+			lines[0] = 'W 0 %s' % header[4]
+		else:
+			workspace = int(header[4])
+			del lines[0]
+
+		layouts = []
+		for line in lines:
+			fields = line.split()
+			if fields[0] == 'W':
+				layouts.append([int(fields[1]), int(fields[2]), None, []])
+			elif fields[0] == 'T':
+				if fields[1:] != ['-']:
+					layouts[-1][2] = fields[1:]
+			else:
+				fields = map(int, fields)
+				layouts[-1][3].append((tuple(fields[:4]), fields[4], fields[5:]))
+	except (IndexError, ValueError):
+		return None
+	numbers = [n for n, current, tree, panes in layouts]
+	if workspace not in numbers or len(set(numbers)) != len(numbers):
+		return None
+	for n, current, tree, panes in layouts:
+		if not 0 <= current < len(panes):
+			return None
+	return workspace, map(tuple, layouts)
+
+def build_tree(tokens, panes):
+	"Turn the tree tokens back into nodes, using panes as the leaves."
+
+	tokens = iter(tokens)
+	def build():
+		t = tokens.next()
+		if t[0] in 'vh':
+			return Split(t[0] == 'v', float(t[1:]), build(), build())
+		return panes[int(t)]
+	return build()
+
+
+def save(screen):
+	"Store the layout of screen on its root window."
+
+	atom = propcache.cache(screen.wm.display).atom(atom_name)
+	screen.root.change_property(atom, Xatom.STRING, 8, encode(screen))
+
+def load(screen):
+	"""Fetch and remove the layout saved on the root window of screen.
+
+	Returns what decode does, or None if there's nothing usable."""
+
+	atom = propcache.cache(screen.wm.display).atom(atom_name)
+	prop = screen.root.get_full_property(atom, Xatom.STRING)
+	if prop is None:
+		return None
+	# Only good for one restart.
+	screen.root.delete_property(atom)
+	return decode(prop.value, screen.root_width, screen.root_height)
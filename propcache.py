@@ -0,0 +1,143 @@
+#
+# propcache.py -- Remember atoms and window properties.
+#
+#	Copyright (C) 2011  Jacob Courtneay <jacob@sporkexec.com>
+#
+#	This program is free software; you can redistribute it and/or modify
+#	it under the terms of the GNU General Public License as published by
+#	the Free Software Foundation; either version 2 of the License, or
+#	(at your option) any later version.
+#
+#	This program is distributed in the hope that it will be useful,
+#	but WITHOUT ANY WARRANTY; without even the implied warranty of
+#	MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#	GNU General Public License for more details.
+#
+#	You should have received a copy of the GNU General Public License
+#	along with this program; if not, write to the Free Software
+#	Foundation, Inc., 59 Temple Place, Suite 330, Boston, MA  02111-1307  USA
+
+"""PropCache - atoms and window properties, asked for once per display.
+
+Every display gets its own PropertyCache from cache(display), so nothing
+breaks when more than one display is managed.
+
+	c = propcache.cache(wm.display)
+	transient = c.get(window, 'WM_TRANSIENT_FOR', Xatom.WINDOW)
+
+Atoms never change once interned. Properties are kept until invalidated,
+which whoever selected PropertyChangeMask on the window has to do by
+passing its PropertyNotify events to property_notify(), and forgotten
+with forget() once the window is gone.
+
+prefetch() sends the request for a property without waiting for the
+reply, so the replies for a lot of windows can be waited for together."""
+
+from Xlib import X, error as xerror
+from Xlib.protocol import request as xrequest
+
+# How much of a property we read, in 32 bit units. Everything we look at
+# is a lot smaller.
+property_length = 1024
+
+class PropertyCache:
+	"PropertyCache - the atoms and properties of one display."
+
+	def __init__(self, display):
+		self.display = display
+		self.atoms = {}			# name -> atom
+		# Kept per window, so forgetting one doesn't look at the rest.
+		self.properties = {}	# window id -> {atom: reply or None}
+		self.pending = {}		# window id -> {atom: unanswered request}
+
+	def atom(self, name):
+		"Return the atom called name, interning it the first time."
+
+		atom = self.atoms.get(name)
+		if atom is None:
+			atom = self.atoms[name] = self.display.intern_atom(name)
+		return atom
+
+	def prefetch(self, window, name, property_type):
+		"Ask for a property of window, not waiting for the answer."
+
+		atom = self.atom(name)
+		if atom in self.properties.get(window.id, ()) or \
+				atom in self.pending.get(window.id, ()):
+			return
+		self.pending.setdefault(window.id, {})[atom] = xrequest.GetProperty(
+			display = self.display.display, delete = 0, window = window,
+			property = atom, type = property_type, long_offset = 0,
+			long_length = property_length)
+
+	def get(self, window, name, property_type):
+		"""Return a property of window, or None if it hasn't got it.
+
+		Whatever comes back has the property_type, format and value
+		attributes of Xlib's get_property."""
+
+		atom = self.atom(name)
+		props = self.properties.get(window.id)
+		if props is not None and atom in props:
+			return props[atom]
+		request = None
+		pending = self.pending.get(window.id)
+		if pending is not None:
+			request = pending.pop(atom, None)
+			if not pending:
+				del self.pending[window.id]
+		if request is None:
+			prop = window.get_property(atom, property_type, 0, property_length)
+		else:
+			try:
+				if request.property_type == X.NONE:
+					prop = None
+				else:
+					prop = request
+			except xerror.XError:
+				# The window is gone, don't remember anything about it.
+				return None
+		self.properties.setdefault(window.id, {})[atom] = prop
+		return prop
+
+	def invalidate(self, window, name = None):
+		"Forget one property of window, or all of them."
+
+		wid = getattr(window, 'id', window)
+		if name is not None:
+			self.drop(wid, self.atom(name))
+			return
+		self.forget(wid)
+
+	def forget(self, window):
+		"Forget everything about window."
+
+		wid = getattr(window, 'id', window)
+		self.properties.pop(wid, None)
+		self.pending.pop(wid, None)
+
+	def drop(self, wid, atom):
+		"Forget one property of the window with id wid."
+
+		for cached in (self.properties, self.pending):
+			props = cached.get(wid)
+			if props is not None:
+				props.pop(atom, None)
+				if not props:
+					del cached[wid]
+
+	def property_notify(self, event):
+		"A property changed; the next get() asks the server again."
+
+		self.drop(event.window.id, event.atom)
+
+
+caches = {}		# display -> PropertyCache
+
+def cache(display):
+	"Return the PropertyCache of display."
+
+	c = caches.get(display)
+	if c is None:
+		c = caches[display] = PropertyCache(display)
+	return c
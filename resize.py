@@ -1,9 +1,36 @@
 # resize.py: functions to help resize panes.
-# Almost directly ported from ratpoison's resizing code because this stuff is hard.
+# Panes that came from splits are resized by moving a divider in the
+# screen's split tree. The fallback is almost directly ported from
+# ratpoison's resizing code because this stuff is hard.
 
-from panes import panefilter
+import time
+import tracing
 
 def resize_pane(frame, action, diff=10):
+	# Every pane touched along the way only gets its windows moved once,
+	# when the whole resize is done.
+	tracing.debug('resize', 'Resizing pane %s: %s by %d', frame, action, diff)
+	tracing.record('resize-' + action, diff, frame.x, frame.y, frame.width, frame.height)
+	s = frame.screen
+	s.panes_begin()
+	try:
+		return _resize_pane(frame, action, diff)
+	finally:
+		s.panes_commit()
+
+def _resize_pane(frame, action, diff):
+	s = frame.screen
+	if s.panes_resize_mode == 'tree' and s.panes_tree is not None:
+		if action == 'vgrow':
+			return resize_split(frame, 0, diff)
+		elif action == 'vshrink':
+			return resize_split(frame, 0, -diff)
+		elif action == 'hgrow':
+			return resize_split(frame, 1, diff)
+		elif action == 'hshrink':
+			return resize_split(frame, 1, -diff)
+		return 0
+
 	if action == 'vgrow':
 		resize_frame_vertically(frame, diff)
 	elif action == 'vshrink':
@@ -13,50 +40,193 @@ def resize_pane(frame, action, diff=10):
 	elif action == 'hshrink':
 		resize_frame_horizontally(frame, -diff)
 
-# Save pane layout of a screen.
-def screen_copy_frameset(s):
-	return [p.get_edges() for p in s.panes_list]
-def screen_restore_frameset(screen, frames):
-	for pane, (t,r,b,l) in zip(screen.panes_list, frames):
-		pane.x = l
-		pane.y = t
-		pane.width = r - l
-		pane.height = b - t
-		pane.replace_all()
-
-frame_top = lambda f: f.y
-frame_right = lambda f: f.x + f.width
-frame_bottom = lambda f: f.y + f.height
-frame_left = lambda f: f.x
-
-def frame_resize_left(frame, amount):
-	frame.x -= amount
-	frame.width += amount
-def frame_resize_right(frame, amount):
-	frame.width += amount
-def frame_resize_up(frame, amount):
-	frame.y -= amount
-	frame.height += amount
-def frame_resize_down(frame, amount):
-	frame.height += amount
-
-def resize_frame_right (frame, pusher, diff):
-	return resize_frame (frame, pusher, diff,
+
+# Holding a resize key down. Every auto-repeat is queued with
+# queue_resize instead of being done right away, and the queue is worked
+# off in one go once the wm has caught up with its events, or every
+# repeat_interval seconds while it hasn't. The longer the key is held,
+# the bigger the steps get.
+repeat_interval = 1.0 / 30
+repeat_gap = 0.25	# Presses further apart than this are a new burst.
+repeat_accel = 5	# Step grows by diff every this many repeats...
+repeat_max = 4		# ...up to this many times diff.
+
+class ResizeQueue:
+	"Resize steps of one screen waiting to be done."
+
+	def __init__(self):
+		self.steps = []		# (frame, action, diff)
+		self.burst = None	# (frame, action, key) being repeated
+		self.count = 0
+		self.last_press = 0.0
+		self.last_apply = 0.0
+
+queues = {}		# screen -> ResizeQueue
+
+def queue_resize(frame, action, diff=10, key=None):
+	"""Resize frame like resize_pane, coalescing key repeat.
+
+	key is the keycode of the key doing it, so flush_resizes can tell
+	its auto-repeat from other events. The panes end up exactly where
+	resize_pane would have put them, called once per step."""
+	s = frame.screen
+	q = queues.get(s)
+	if q is None:
+		q = queues[s] = ResizeQueue()
+	now = time.time()
+	if q.burst != (frame, action, key) or now - q.last_press > repeat_gap:
+		q.burst = (frame, action, key)
+		q.count = 0
+	else:
+		q.count += 1
+	q.last_press = now
+	q.steps.append((frame, action, diff * min(1 + q.count / repeat_accel, repeat_max)))
+	if now - q.last_apply >= repeat_interval or not frame.wm.display.pending_events():
+		flush_resizes(s)
+
+def flush_resizes(screen, event=None):
+	"""Do the queued resizes of screen.
+
+	If event is given, it's the one about to be handled, and the queue
+	is left alone if that's just more of the key being held down."""
+	q = queues.get(screen)
+	if q is None or not q.steps:
+		return
+	if event is not None and q.burst[2] is not None and \
+			getattr(event, 'detail', None) == q.burst[2]:
+		return
+	steps, q.steps = q.steps, []
+	q.last_apply = time.time()
+	screen.panes_begin()
+	try:
+		i = 0
+		while i < len(steps):
+			frame, action, diff = steps[i]
+			j = i + 1
+			while j < len(steps) and steps[j][:2] == (frame, action):
+				j += 1
+			# Moving a divider by the sum of the steps gives the same
+			# layout as moving it step by step, unless something ran out of
+			# room on the way.
+			if j - i == 1 or frame.screen.panes_resize_mode != 'tree' or \
+					frame.screen.panes_tree is None or \
+					not resize_pane(frame, action, sum([d for f, a, d in steps[i:j]])):
+				for frame, action, diff in steps[i:j]:
+					resize_pane(frame, action, diff)
+			i = j
+	finally:
+		screen.panes_commit()
+
+''' Resize frame diff pixels by moving the closest divider of the split
+   tree along the axis, right/down if there is one, left/up otherwise.
+   Only the panes under the divider's node are laid out again. '''
+def resize_split(frame, vertical, diff):
+	s = frame.screen
+	tree = s.panes_tree
+	node, first = tree.divider(frame, vertical)
+	if node is None or diff == 0:
+		return 0
+
+	t, r, b, l = tree.get_edges(node)
+	if vertical:
+		total = r - l
+	else:
+		total = b - t
+	second = int(total * node.ratio + .5)
+	if first:
+		second -= diff
+	else:
+		second += diff
+	if not 0 < second < total:
+		return 0
+
+	old_ratio = node.ratio
+	node.ratio = float(second) / total
+	rects = tree.layout(node, l, t, r - l, b - t, {})
+	for x, y, width, height in rects.values():
+		if width <= 0 or height <= 0:
+			# Somebody under the divider can't get any smaller.
+			node.ratio = old_ratio
+			return 0
+
+	for pane, (x, y, width, height) in rects.items():
+		if (pane.x, pane.y, pane.width, pane.height) != (x, y, width, height):
+			pane.x, pane.y, pane.width, pane.height = x, y, width, height
+			s.panes_graph.touch(pane)
+			pane.replace_all()
+	frame.activate()
+	return 1
+
+# The ratpoison resize works on a copy of the rectangles it changes,
+# rects, and only touches the panes once it knows the resize can be done.
+# Looking at edges is what it does most, so panes it hasn't changed are
+# read directly.
+def frame_rect(rects, f):
+	if f in rects:
+		return rects[f]
+	return f.x, f.y, f.width, f.height
+
+def frame_top(rects, f):
+	if f in rects:
+		return rects[f][1]
+	return f.y
+def frame_right(rects, f):
+	if f in rects:
+		x, y, width, height = rects[f]
+		return x + width
+	return f.x + f.width
+def frame_bottom(rects, f):
+	if f in rects:
+		x, y, width, height = rects[f]
+		return y + height
+	return f.y + f.height
+def frame_left(rects, f):
+	if f in rects:
+		return rects[f][0]
+	return f.x
+
+def frame_resize_left(rects, frame, amount):
+	x, y, width, height = frame_rect(rects, frame)
+	rects[frame] = (x - amount, y, width + amount, height)
+def frame_resize_right(rects, frame, amount):
+	x, y, width, height = frame_rect(rects, frame)
+	rects[frame] = (x, y, width + amount, height)
+def frame_resize_up(rects, frame, amount):
+	x, y, width, height = frame_rect(rects, frame)
+	rects[frame] = (x, y - amount, width, height + amount)
+def frame_resize_down(rects, frame, amount):
+	x, y, width, height = frame_rect(rects, frame)
+	rects[frame] = (x, y, width, height + amount)
+
+def resize_frame_right (rects, frame, pusher, diff):
+	return resize_frame (rects, frame, pusher, diff,
 		frame_left, frame_top, frame_right, frame_bottom,
 		frame_resize_right, frame_resize_left, resize_frame_left)
-def resize_frame_left (frame, pusher, diff):
-	return resize_frame (frame, pusher, diff,
+def resize_frame_left (rects, frame, pusher, diff):
+	return resize_frame (rects, frame, pusher, diff,
 		frame_right, frame_top, frame_left, frame_bottom,
 		frame_resize_left, frame_resize_right, resize_frame_right)
-def resize_frame_top (frame, pusher, diff):
-	return resize_frame (frame, pusher, diff,
+def resize_frame_top (rects, frame, pusher, diff):
+	return resize_frame (rects, frame, pusher, diff,
 		frame_bottom, frame_left, frame_top, frame_right,
 		frame_resize_up, frame_resize_down, resize_frame_bottom)
-def resize_frame_bottom (frame, pusher, diff):
-	return resize_frame (frame, pusher, diff,
+def resize_frame_bottom (rects, frame, pusher, diff):
+	return resize_frame (rects, frame, pusher, diff,
 		frame_top, frame_left, frame_bottom, frame_right,
 		frame_resize_down, frame_resize_up, resize_frame_top)
 
+def apply_frame_rects(frame, rects):
+	"Give the panes the rectangles a successful resize worked out."
+	s = frame.screen
+	for pane, (x, y, width, height) in rects.items():
+		if (pane.x, pane.y, pane.width, pane.height) != (x, y, width, height):
+			pane.x, pane.y, pane.width, pane.height = x, y, width, height
+			s.panes_graph.touch(pane)
+			pane.replace_all()
+	frame.activate()
+	# Edges got pushed around without the split tree knowing.
+	s.panes_tree = None
+
 
 ''' Resize frame diff pixels by expanding it to the right. If the frame
    is against the right side of the screen, expand it to the left. '''
@@ -76,10 +246,10 @@ def resize_frame_horizontally(frame, diff):
 	else:
 		return
 
-	# Copy the frameset. If the resize fails, then we restore the original one.
-	l = screen_copy_frameset (s)
-	if resize_fn(frame, None, diff) == -1:
-		screen_restore_frameset (s, l)
+	# Nothing changes unless the whole resize can be done.
+	rects = {}
+	if resize_fn(rects, frame, None, diff) != -1:
+		apply_frame_rects(frame, rects)
 
 ''' Resize frame diff pixels by expanding it down. If the frame is
    against the bottom of the screen, expand it up. '''
@@ -99,28 +269,32 @@ def resize_frame_vertically (frame, diff):
 	else:
 		return
 
-	# Copy the frameset. If the resize fails, then we restore the original one.
-	l = screen_copy_frameset (s)
-	if resize_fn(frame, None, diff) == -1:
-		screen_restore_frameset (s, l)
+	# Nothing changes unless the whole resize can be done.
+	rects = {}
+	if resize_fn(rects, frame, None, diff) != -1:
+		apply_frame_rects(frame, rects)
 
 
 
-def resize_frame (frame, pusher, diff, c1, c2, c3, c4,
+def resize_frame (rects, frame, pusher, diff, c1, c2, c3, c4,
 					resize1, resize2, resize3):
+	''' Work out in rects what resizing frame by diff does to it and to
+	everybody it pushes. Returns -1 if someone would get too small. '''
 	s = frame.screen
 
 	# Loop through the frames and determine which ones are affected by resizing frame. 
+	f2, f3, f4 = c2(rects, frame), c3(rects, frame), c4(rects, frame)
 	for cur in s.panes_list:
 		if cur == frame or cur == pusher:
 			continue
 		# If cur is touching frame along the axis that is being
 		#	 moved then this frame is affected by the resize. 
-		if c1(cur) == c3(frame):
+		if c1(rects, cur) == f3:
 			# If the frame can't get any smaller, then fail. 
-			if diff > 0 and abs(c3(cur) - c1(cur)) - diff <= 0:
+			if diff > 0 and abs(c3(rects, cur) - c1(rects, cur)) - diff <= 0:
 				return -1
-			if c2(cur) >= c2(frame) and c4(cur) <= c4(frame):
+			cur2, cur4 = c2(rects, cur), c4(rects, cur)
+			if cur2 >= f2 and cur4 <= f4:
 				''' Test for this circumstance:
 				--+
 				| |+-+
@@ -131,22 +305,21 @@ def resize_frame (frame, pusher, diff, c1, c2, c3, c4,
 				In this case, resizing cur will not affect any other
 				frames, so just do the resize.
 				'''
-				resize2(cur, -diff)
-				cur.replace_all()
-			elif ((c2(cur) < c2(frame) and c4(cur) > c4(frame))
-					or (c2(cur) >= c2(frame) and c2(cur) < c4(frame))
-					or (c4(cur) > c2(frame) and c4(cur) <= c4(frame))):
+				resize2(rects, cur, -diff)
+			elif ((cur2 < f2 and cur4 > f4)
+					or (cur2 >= f2 and cur2 < f4)
+					or (cur4 > f2 and cur4 <= f4)):
 				''' Otherwise, cur's corners are either strictly outside
 				frame's corners, or one of them is inside and the other
 				isn't. In either of these cases, resizing cur will affect
 				other adjacent frames, so find them and resize them first
 				(recursive step) and then resize cur. '''
 				# Attempt to resize cur. 
-				if resize3(cur, frame, -diff) == -1:
+				if resize3(rects, cur, frame, -diff) == -1:
 					return -1
+				# That may have pushed frame around too.
+				f2, f3, f4 = c2(rects, frame), c3(rects, frame), c4(rects, frame)
 
-	# Finally, resize the frame and the windows inside. 
-	resize1(frame, diff)
-	frame.replace_all()
-	frame.activate()
+	# Finally, resize the frame.
+	resize1(rects, frame, diff)
 	return 0
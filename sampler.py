@@ -0,0 +1,238 @@
+#
+# sampler.py -- A sampling profiler to switch on in a running wm.
+#
+#	Copyright (C) 2011  Jacob Courtneay <jacob@sporkexec.com>
+#
+#	This program is free software; you can redistribute it and/or modify
+#	it under the terms of the GNU General Public License as published by
+#	the Free Software Foundation; either version 2 of the License, or
+#	(at your option) any later version.
+#
+#	This program is distributed in the hope that it will be useful,
+#	but WITHOUT ANY WARRANTY; without even the implied warranty of
+#	MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#	GNU General Public License for more details.
+#
+#	You should have received a copy of the GNU General Public License
+#	along with this program; if not, write to the Free Software
+#	Foundation, Inc., 59 Temple Place, Suite 330, Boston, MA  02111-1307  USA
+
+"""Sampler - see where a running wm spends its time, without a restart.
+
+start() has the kernel send us SIGALRM every interval seconds of real
+time, and the handler counts the Python stack it interrupted. stop()
+turns that off again and returns the counts. While not sampling nothing
+is installed at all, so it costs nothing.
+
+Time spent blocked is sampled too. While sampling, select.select is
+wrapped so a sample can tell it stopped in one: the event loop in
+plwm.event waiting for something to do gets a 'select:idle' frame, and
+anybody else, Xlib waiting for the server mostly, a 'select:wait' one.
+
+The stacks are written collapsed, one 'frame;frame;frame count' line
+each, outermost frame first, which is what flamegraph.pl and friends
+read. Frames are 'module:function', with plwm and Xlib modules named by
+their full dotted name.
+
+SamplerManager is a WindowManager mixin that samples for a while and
+then writes the stacks to a file. Running this file on such a file
+prints how the samples split up between our modules, plwm, Xlib,
+Xlib's socket I/O and waiting for the server, and idling."""
+
+import os, sys, time, errno, signal, select
+from plwm import event
+import tracing
+
+interval = .005
+
+idle_frame = 'select:idle'
+wait_frame = 'select:wait'
+
+samples = None	# tuple of code objects -> count, while sampling
+names = {}		# code object -> frame name
+waiting = None	# code object of whoever is in select, while sampling
+taken = 0		# samples so far
+
+real_select = select.select
+
+def _select(rlist, wlist, xlist, timeout = None):
+	global waiting
+	waiting = sys._getframe(1).f_code
+	if timeout is not None:
+		end = time.time() + timeout
+	try:
+		while 1:
+			before = taken
+			try:
+				return real_select(rlist, wlist, xlist, timeout)
+			except select.error, e:
+				# If a sample broke it off, wait out the rest. Other
+				# signals are the caller's business.
+				if e.args[0] != errno.EINTR or taken == before:
+					raise
+			if timeout is not None:
+				timeout = max(end - time.time(), 0)
+	finally:
+		waiting = None
+
+def _sample(signum, frame):
+	global taken
+	taken += 1
+	stack = []
+	if waiting is not None:
+		if frame_name(waiting).startswith('plwm.event:'):
+			stack.append(idle_frame)
+		else:
+			stack.append(wait_frame)
+	while frame is not None:
+		if frame.f_code is not _select.func_code:
+			stack.append(frame.f_code)
+		frame = frame.f_back
+	key = tuple(stack)
+	samples[key] = samples.get(key, 0) + 1
+
+def start(every = None):
+	"Start sampling, every seconds of real time or every interval."
+
+	global samples
+	if samples is not None:
+		return
+	samples = {}
+	select.select = _select
+	signal.signal(signal.SIGALRM, _sample)
+	# Let reads and writes go on after a sample. select gets broken off
+	# anyway, _select takes care of that.
+	signal.siginterrupt(signal.SIGALRM, False)
+	signal.setitimer(signal.ITIMER_REAL, every or interval, every or interval)
+
+def stop():
+	"Stop sampling, returning the collapsed stacks and their counts."
+
+	global samples
+	if samples is None:
+		return {}
+	signal.setitimer(signal.ITIMER_REAL, 0, 0)
+	# One may still be on its way, and SIGALRM kills us by default.
+	signal.signal(signal.SIGALRM, signal.SIG_IGN)
+	select.select = real_select
+	taken, samples = samples, None
+	stacks = {}
+	for codes, count in taken.items():
+		key = ';'.join([frame_name(c) for c in reversed(codes)])
+		stacks[key] = stacks.get(key, 0) + count
+	return stacks
+
+def running():
+	return samples is not None
+
+def module_name(filename):
+	"Name the module in filename, dotted from the package for plwm and Xlib."
+
+	parts = os.path.splitext(filename)[0].split(os.sep)
+	for package in ('Xlib', 'plwm'):
+		if package in parts:
+			i = len(parts) - 1 - parts[::-1].index(package)
+			return '.'.join(parts[i:])
+	return parts[-1]
+
+def frame_name(code):
+	if isinstance(code, str):
+		return code
+	name = names.get(code)
+	if name is None:
+		name = names[code] = '%s:%s' % (module_name(code.co_filename), code.co_name)
+	return name
+
+def group(stack):
+	"Which part of the wm the innermost frame of a collapsed stack is in."
+
+	frames = stack.split(';')
+	if frames[-1] == idle_frame:
+		return 'idle'
+	if frames[-1] == wait_frame:
+		if len(frames) > 1 and frames[-2].startswith('Xlib.'):
+			return 'Xlib waiting for the server'
+		frames.pop()
+	module = frames[-1].split(':')[0]
+	if module == 'Xlib.protocol.display':
+		return 'Xlib socket I/O'
+	if module.startswith('Xlib.'):
+		return 'Xlib'
+	if module.startswith('plwm.'):
+		return 'plwm'
+	return module
+
+def write(f, stacks):
+	keys = stacks.keys()
+	keys.sort()
+	for key in keys:
+		f.write('%s %d\n' % (key, stacks[key]))
+
+def dump_file(stacks, path = None):
+	"Write stacks to path, by default one in /tmp named after our pid."
+
+	if path is None:
+		path = default_path()
+	f = open(path, 'w')
+	try:
+		write(f, stacks)
+	finally:
+		f.close()
+	return path
+
+def default_path():
+	return '/tmp/postmortwm-profile.%d' % os.getpid()
+
+
+SamplerTimerEvent = event.new_event_type()
+
+class SamplerManager:
+	"SamplerManager - WindowManager mixin profiling for a while on request."
+
+	def __wm_init__(self):
+		self.sampler_timer = None
+		self.sampler_path = None
+		self.dispatch.add_handler(SamplerTimerEvent, self.sampler_done)
+
+	def sampler_profile(self, seconds = 10, path = None):
+		"""Sample for seconds, then write the stacks to path.
+
+		Returns the path they'll be in, or None if we're sampling already."""
+
+		if running():
+			return None
+		self.sampler_path = path or default_path()
+		start()
+		self.sampler_timer = event.TimerEvent(SamplerTimerEvent, after = seconds)
+		self.events.add_timer(self.sampler_timer)
+		return self.sampler_path
+
+	def sampler_done(self, ev = None):
+		"Stop sampling and write out what we've got."
+
+		if self.sampler_timer is not None:
+			self.sampler_timer.cancel()
+			self.sampler_timer = None
+		if running():
+			try:
+				dump_file(stop(), self.sampler_path)
+			except IOError, e:
+				# Nowhere to put them is no reason to take the wm down.
+				tracing.debug('Sampler', 'Cannot write %s: %s', self.sampler_path, e)
+
+
+def main(args):
+	totals = {}
+	total = 0
+	for path in args:
+		for line in open(path):
+			stack, count = line.rsplit(None, 1)
+			totals[group(stack)] = totals.get(group(stack), 0) + int(count)
+			total += int(count)
+	parts = totals.items()
+	parts.sort(lambda a, b: cmp(b[1], a[1]))
+	for name, count in parts:
+		print '%-24s %8d %6.1f%%' % (name, count, count * 100. / max(total, 1))
+
+if __name__ == '__main__':
+	main(sys.argv[1:])
@@ -0,0 +1,514 @@
+#
+# sim.py -- Run the pane code without an X server.
+#
+#	Copyright (C) 2011  Jacob Courtneay <jacob@sporkexec.com>
+#
+#	This program is free software; you can redistribute it and/or modify
+#	it under the terms of the GNU General Public License as published by
+#	the Free Software Foundation; either version 2 of the License, or
+#	(at your option) any later version.
+#
+#	This program is distributed in the hope that it will be useful,
+#	but WITHOUT ANY WARRANTY; without even the implied warranty of
+#	MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#	GNU General Public License for more details.
+#
+#	You should have received a copy of the GNU General Public License
+#	along with this program; if not, write to the Free Software
+#	Foundation, Inc., 59 Temple Place, Suite 330, Boston, MA  02111-1307  USA
+
+"""Sim - an in-memory stand-in for the bits of plwm and X we use.
+
+SimWM, SimScreen and SimClient look enough like plwm's WindowManager,
+Screen and Client for panes.py, focus.py and resize.py to run on them
+as they are: SimScreen and SimClient are built from the real
+panesScreen and panesClient mixins, SimWM from the real panesManager
+and MoveFocus.
+Nothing talks to a server; SimDisplay counts (and optionally logs) the
+requests that would have been sent instead.
+
+	wm = SimWM(1280, 1024)
+	s = wm.screens[0]
+	for i in range(1000):
+		wm.new_client(s)
+	s.current_pane.vertical_split()
+	print wm.display.counts
+
+Running this file does a stress run over a big layout; see --help."""
+
+from Xlib import X, Xatom
+import panes, focus, persist, propcache
+
+class SimDisplay:
+	"SimDisplay - counts the requests the wm makes."
+
+	def __init__(self, log = 0):
+		self.counts = {}
+		self.log = None
+		if log:
+			self.log = []
+		self.atoms = {}
+		self.next_id = 0x200000
+		# What pending_events() says; a replay sets it to batch events.
+		self.pending = 0
+		# (client, event) the server has yet to send, see deliver_events().
+		self.events = []
+		self.stacking = []		# window ids, bottom to top
+
+	def restack(self, wid):
+		"Put the window with id wid on top."
+
+		if wid in self.stacking:
+			self.stacking.remove(wid)
+		self.stacking.append(wid)
+
+	def request(self, name, *args):
+		self.counts[name] = self.counts.get(name, 0) + 1
+		if self.log is not None:
+			self.log.append((name,) + args)
+
+	def requests(self):
+		"Total number of requests so far."
+		return sum(self.counts.values())
+
+	def reset(self):
+		self.counts = {}
+		if self.log is not None:
+			self.log = []
+
+	def new_id(self):
+		self.next_id += 1
+		return self.next_id
+
+	def flush(self):
+		self.request('flush')
+
+	def sync(self):
+		self.request('sync')
+
+	def grab_server(self):
+		self.request('grab_server')
+
+	def ungrab_server(self):
+		self.request('ungrab_server')
+
+	def pending_events(self):
+		return self.pending
+
+	def has_extension(self, name):
+		return 0
+
+	def intern_atom(self, name, only_if_exists = 0):
+		atom = self.atoms.get(name)
+		if atom is None:
+			atom = self.atoms[name] = len(self.atoms) + 100
+		return atom
+
+
+class SimProperty:
+	def __init__(self, property_type, format, value):
+		self.property_type, self.format, self.value = property_type, format, value
+
+class SimAttributes:
+	def __init__(self, event_mask):
+		self.your_event_mask = event_mask
+
+class SimWindow:
+	"SimWindow - an X window that only remembers what was done to it."
+
+	def __init__(self, display, id = None):
+		self.display = display
+		self.id = id or display.new_id()
+		self.properties = {}
+		self.mapped = 0
+		self.event_mask = 0
+		display.restack(self.id)
+
+	def __resource__(self):
+		return self.id
+
+	__window__ = __resource__
+
+	def configure(self, **keys):
+		if keys.get('stack_mode') == X.Above:
+			self.display.restack(self.id)
+		self.display.request('configure', self.id, keys)
+
+	def get_attributes(self):
+		self.display.request('get_attributes', self.id)
+		return SimAttributes(self.event_mask)
+
+	def change_attributes(self, event_mask = None, **keys):
+		if event_mask is not None:
+			self.event_mask = event_mask
+		self.display.request('change_attributes', self.id)
+
+	def map(self):
+		# A server leaves the stacking order alone; putting the window on
+		# top is the worst case for whoever is meant to be on top.
+		self.mapped = 1
+		self.display.restack(self.id)
+		self.display.request('map', self.id)
+
+	def unmap(self):
+		self.mapped = 0
+		self.display.request('unmap', self.id)
+
+	def destroy(self):
+		self.display.request('destroy', self.id)
+
+	def warp_pointer(self, x, y):
+		self.display.request('warp', self.id, x, y)
+
+	def send_event(self, event, event_mask = 0, *args):
+		self.display.request('send_event', self.id, event.__class__.__name__)
+
+	def shape_rectangles(self, *args):
+		self.display.request('shape', self.id)
+
+	def create_window(self, *args, **keys):
+		self.display.request('create', self.id)
+		return SimWindow(self.display)
+
+	def change_property(self, atom, property_type, format, value, *args):
+		self.properties[atom] = SimProperty(property_type, format, value)
+		self.display.request('change_property', self.id, atom)
+
+	def delete_property(self, atom):
+		self.properties.pop(atom, None)
+		self.display.request('delete_property', self.id, atom)
+
+	def get_full_property(self, atom, property_type):
+		self.display.request('get_property', self.id, atom)
+		return self.properties.get(atom)
+
+	def query_tree(self):
+		# Nothing exists before the wm starts.
+		return SimTree()
+
+	def get_property(self, atom, property_type, offset, length):
+		return self.get_full_property(atom, property_type)
+
+
+class SimTree:
+	children = ()
+
+
+class SimDispatcher:
+	"SimDispatcher - the part of plwm's event.Dispatcher we use."
+
+	def __init__(self):
+		self.handlers = {}
+
+	def add_handler(self, event_type, handler, *args, **keys):
+		self.handlers.setdefault(event_type, []).append(handler)
+
+	def dispatch_event(self, event, *args):
+		for handler in self.handlers.get(getattr(event, 'type', None), []):
+			handler(event)
+
+class SimMiscDispatcher:
+	"SimMiscDispatcher - misc_dispatch, handlers picked by a filter."
+
+	def __init__(self):
+		self.handlers = []
+
+	def add_handler(self, handler, test, *args, **keys):
+		# Same argument order OutlinePane uses.
+		self.handlers.append((handler, test))
+
+	def dispatch_event(self, event, *args):
+		for handler, test in self.handlers:
+			if test(event):
+				handler(event)
+
+
+class SimEvent:
+	def __init__(self, event_type, **keys):
+		self.type = event_type
+		self.__dict__.update(keys)
+
+
+class SimInfo:
+	white_pixel = 1
+	black_pixel = 0
+
+class SimScreen(panes.panesScreen):
+	"SimScreen - a plwm Screen with panes, minus the server."
+
+	def __init__(self, wm, number, width, height, saved = None):
+		self.wm = wm
+		self.number = number
+		self.root_width, self.root_height = width, height
+		self.root = SimWindow(wm.display)
+		self.info = SimInfo()
+		self.dispatch = SimDispatcher()
+		self.clients = {}	# window id -> SimClient
+		if saved is None:
+			self.__screen_client_init__()
+			return
+		# Start like after a restart: the layout is on the root window and
+		# its windows are there to be adopted.
+		atom = propcache.cache(wm.display).atom(persist.atom_name)
+		self.root.change_property(atom, Xatom.STRING, 8, saved)
+		self.__screen_client_init__()
+		layouts = persist.decode(saved, width, height)
+		if layouts is not None:
+			for n, current, tree, panes in layouts[1]:
+				for geometry, visible, ids in panes:
+					for i in ids:
+						SimClient(self, window = SimWindow(wm.display, i))
+
+	def query_clients(self, client_filter = None, stackorder = 0):
+		return [c for c in self.clients.values()
+				if client_filter is None or client_filter(c)]
+
+	def get_window(self, window):
+		return self.clients.get(getattr(window, 'id', window))
+
+	def allow_self_changes(self, client):
+		return 1
+
+	def system(self, command):
+		pass
+
+
+class SimClient(panes.panesClient):
+	"SimClient - a managed window that only remembers its geometry."
+
+	border_width = 0
+	sizehints = None
+
+	def __init__(self, screen, x = 0, y = 0, width = 100, height = 100,
+				window = None):
+		self.screen = screen
+		self.wm = screen.wm
+		self.window = window or SimWindow(self.wm.display)
+		# It's being managed because the client mapped it.
+		self.window.mapped = 1
+		self.x, self.y, self.width, self.height = x, y, width, height
+		self.withdrawn = 0
+		self.mapped = 1
+		self.dispatch = SimDispatcher()
+		screen.clients[self.window.id] = self
+		self.__client_init__()
+
+	def __repr__(self):
+		return '<SimClient %#x>' % self.window.id
+
+	def keep_on_screen(self, x, y, width, height):
+		return x, y, width, height
+
+	def moveresize(self, x, y, width, height, delayed = 0):
+		self.x, self.y, self.width, self.height = x, y, width, height
+		self.wm.display.request('moveresize', self.window.id, x, y, width, height)
+
+	def resize(self, width, height):
+		self.moveresize(self.x, self.y, width, height)
+
+	def activate(self):
+		# Like plwm's, raises the window and focuses it.
+		self.raisewindow()
+		self.wm.current_client = self
+		self.wm.display.request('set_input_focus', self.window.id)
+
+	def raisewindow(self):
+		self.window.configure(stack_mode = X.Above)
+
+	def warppointer(self, x = 0, y = 0):
+		self.window.warp_pointer(x, y)
+
+	def iconify(self):
+		self.mapped = 0
+		self.window.unmap()
+		# Like from a server, the UnmapNotify comes later.
+		self.wm.display.events.append((self, SimEvent(X.UnmapNotify,
+			window = self.window, send_event = 0)))
+
+	def deiconify(self):
+		self.mapped = 1
+		self.window.map()
+
+	def unmap(self):
+		"The client went away: tell the handlers and forget it."
+
+		# Whatever the server sent before comes first. An iconic window
+		# withdraws with a synthetic UnmapNotify.
+		self.wm.deliver_events()
+		self.withdrawn = 1
+		self.dispatch.dispatch_event(SimEvent(X.UnmapNotify, window = self.window,
+			send_event = self.panes_hidden))
+		del self.screen.clients[self.window.id]
+
+	def configure_request(self, value_mask, **keys):
+		"Have the client ask for a new geometry."
+
+		# Like the real thing, every field is there, used or not.
+		fields = {'x': self.x, 'y': self.y, 'width': self.width,
+			'height': self.height, 'border_width': 0, 'stack_mode': X.Above}
+		fields.update(keys)
+		self.screen.dispatch.dispatch_event(SimEvent(X.ConfigureRequest,
+			window = self.window, value_mask = value_mask, **fields))
+
+
+class SimWM(panes.panesManager, focus.MoveFocus):
+	"SimWM - a plwm WindowManager with one or more fake screens."
+
+	def __init__(self, width = 1280, height = 1024, screens = 1, log = 0,
+				saved = {}):
+		"""saved can have a persist.encode() layout for each screen number,
+		to start out with as if the wm was restarted."""
+
+		self.display = SimDisplay(log)
+		self.misc_dispatch = SimMiscDispatcher()
+		self.current_client = None
+		self.current_screen = None
+		self.screens = []
+		for i in range(screens):
+			self.screens.append(SimScreen(self, i, width, height, saved.get(i)))
+		self.current_screen = self.screens[0]
+		for s in self.screens:
+			s.__screen_init__()
+
+	def set_current_client(self, client):
+		self.current_client = client
+
+	def deliver_events(self):
+		"Hand the clients the events the server has sent since last time."
+
+		events, self.display.events = self.display.events, []
+		for client, event in events:
+			if not client.withdrawn:
+				client.dispatch.dispatch_event(event)
+
+	def new_client(self, screen = None, **keys):
+		"Map a new window on screen, like a MapRequest would."
+
+		if screen is None:
+			screen = self.current_screen
+		return SimClient(screen, **keys)
+
+
+if __name__ == '__main__':
+	# Stress run: build a big layout, fill it with windows and time the
+	# usual operations on it. --profile shows where the time goes.
+	import sys, time, random, optparse
+	from resize import resize_pane
+
+	parser = optparse.OptionParser(usage = '%prog [options]')
+	parser.add_option('--panes', type = 'int', default = 1000)
+	parser.add_option('--windows', type = 'int', default = 10000)
+	parser.add_option('--repeat', type = 'int', default = 1000)
+	parser.add_option('--seed', type = 'int', default = 0)
+	parser.add_option('--ratpoison', action = 'store_true')
+	parser.add_option('--iconify', action = 'store_true',
+		help = 'iconify windows hidden in their pane')
+	parser.add_option('--workspaces', type = 'int', default = 1,
+		help = 'deal the windows out over this many workspaces and time '
+			'switching between them')
+	parser.add_option('--profile', action = 'store_true')
+	opts, args = parser.parse_args()
+
+	def run():
+		rand = random.Random(opts.seed)
+		wm = SimWM(8192, 8192)
+		s = wm.screens[0]
+		if opts.ratpoison:
+			s.panes_resize_mode = 'ratpoison'
+		s.panes_iconify_hidden = opts.iconify
+
+		def timed(name, fn, ops):
+			wm.display.reset()
+			start = time.time()
+			fn()
+			wall = time.time() - start
+			print '%-16s %8d ops %10.3f s %10.1f us/op %10d requests' % (
+				name, ops, wall, wall / max(ops, 1) * 1e6, wm.display.requests())
+
+		def split():
+			while len(s.panes_list) < opts.panes:
+				p = rand.choice(s.panes_list)
+				if p.width > p.height:
+					if p.width > 8:
+						p.vertical_split()
+				elif p.height > 8:
+					p.horizontal_split()
+		timed('split', split, opts.panes)
+
+		def fill():
+			for i in xrange(opts.windows):
+				rand.choice(s.panes_list).activate()
+				wm.new_client(s)
+		timed('map', fill, opts.windows)
+
+		actions = ('hgrow', 'hshrink', 'vgrow', 'vshrink')
+		def resize():
+			for i in xrange(opts.repeat):
+				resize_pane(rand.choice(s.panes_list), rand.choice(actions))
+		timed('resize', resize, opts.repeat)
+
+		dirs = ('left', 'right', 'up', 'down')
+		def move_focus():
+			for i in xrange(opts.repeat):
+				wm.move_focus(rand.choice(dirs))
+		timed('move_focus', move_focus, opts.repeat)
+
+		def move_window():
+			for i in xrange(opts.repeat):
+				s.current_pane.move_window(rand.choice(dirs))
+		timed('move_window', move_window, opts.repeat)
+
+		if opts.workspaces > 1:
+			clients = s.query_clients()
+			for n in range(1, opts.workspaces):
+				s.panes_switch_workspace(n)
+				split()
+				s.panes_switch_workspace(0)
+			for c in clients:
+				s.panes_send_window(c, rand.randrange(opts.workspaces))
+			def switch():
+				for i in xrange(opts.repeat):
+					s.panes_switch_workspace(rand.randrange(opts.workspaces))
+					wm.deliver_events()
+			timed('workspace', switch, opts.repeat)
+			s.panes_switch_workspace(0)
+			wm.deliver_events()
+
+			# Switching there and back before the server's UnmapNotifies
+			# for the first switch come in mustn't lose any windows.
+			s.panes_switch_workspace(1)
+			s.panes_switch_workspace(0)
+			wm.deliver_events()
+			lost = [c for c in clients if c.pane is None]
+			if lost:
+				print 'windows left without a pane:', lost[:5]
+				sys.exit(1)
+
+			# And each pane has to show its own window on top again.
+			stacking = wm.display.stacking
+			wrong = []
+			for p in s.panes_list:
+				ids = [w.window.id for w in p.window_list if w.window.mapped]
+				if ids and max(ids, key = stacking.index) != p.window.window.id:
+					wrong.append(p)
+			if wrong:
+				print 'panes with another window on top:', wrong[:5]
+				sys.exit(1)
+
+		def unmap():
+			for c in s.query_clients():
+				c.unmap()
+		timed('unmap', unmap, opts.windows)
+
+		problems = s.panes_graph.check(s.panes_list)
+		if problems:
+			print 'adjacency graph is inconsistent:', problems[:5]
+			sys.exit(1)
+
+	if opts.profile:
+		import cProfile, pstats
+		prof = cProfile.Profile()
+		prof.runcall(run)
+		pstats.Stats(prof).sort_stats('cumulative').print_stats(30)
+	else:
+		run()
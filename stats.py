@@ -0,0 +1,240 @@
+#
+# stats.py -- Where does the wm spend its time?
+#
+#	Copyright (C) 2011  Jacob Courtneay <jacob@sporkexec.com>
+#
+#	This program is free software; you can redistribute it and/or modify
+#	it under the terms of the GNU General Public License as published by
+#	the Free Software Foundation; either version 2 of the License, or
+#	(at your option) any later version.
+#
+#	This program is distributed in the hope that it will be useful,
+#	but WITHOUT ANY WARRANTY; without even the implied warranty of
+#	MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#	GNU General Public License for more details.
+#
+#	You should have received a copy of the GNU General Public License
+#	along with this program; if not, write to the Free Software
+#	Foundation, Inc., 59 Temple Place, Suite 330, Boston, MA  02111-1307  USA
+
+"""Stats - per-event and per-handler latency histograms.
+
+Turned on by setting POSTMORTWM_STATS in the environment. When it's off,
+timed() and instrument_class() hand back what they were given and
+nothing is measured at all.
+
+Every measured call counts towards a Stat: how often it ran, a log2
+histogram of how long it took, how many X requests it sent and how much
+of its time was spent blocked waiting for replies from the server, so
+slow handlers can be told apart from slow round-trips.
+
+StatsManager is a WindowManager mixin that measures every event as it
+is handled, by X event type (or class name, for our own events)."""
+
+import os, time
+from Xlib import X
+from plwm import wmanager
+
+enabled = os.environ.has_key('POSTMORTWM_STATS')
+
+# Histogram buckets are powers of two in microseconds, the last one
+# catches everything slower.
+buckets = 24
+
+class Stat:
+	"Stat - counters for one event type or handler."
+
+	def __init__(self, name):
+		self.name = name
+		self.count = 0
+		self.total = 0.0
+		self.max = 0.0
+		self.blocked = 0.0
+		self.requests = 0
+		self.roundtrips = 0
+		self.histogram = [0] * buckets
+
+	def add(self, elapsed, requests, roundtrips, blocked):
+		self.count += 1
+		self.total += elapsed
+		if elapsed > self.max:
+			self.max = elapsed
+		self.requests += requests
+		self.roundtrips += roundtrips
+		self.blocked += blocked
+		us = int(elapsed * 1e6)
+		bucket = 0
+		while us > 1 and bucket < buckets - 1:
+			us >>= 1
+			bucket += 1
+		self.histogram[bucket] += 1
+
+	def format(self):
+		hist = ' '.join(['<%dus:%d' % (2 << i, n)
+						for i, n in enumerate(self.histogram) if n])
+		return '%-32s %7d %10.3f %9.1f %9.1f %10.3f %10.3f %8d %6d  %s' % (
+			self.name, self.count, self.total * 1e3,
+			self.total / self.count * 1e6, self.max * 1e6,
+			(self.total - self.blocked) * 1e3, self.blocked * 1e3,
+			self.requests, self.roundtrips, hist)
+
+table = {}		# name -> Stat
+
+# What the hooked display has done so far.
+protocol_display = None
+blocked_total = 0.0
+roundtrips_total = 0
+
+def hook_display(display):
+	"""Watch display for requests and round-trips.
+
+	Requests are counted from the request serial number. Waiting for a
+	reply goes through send_and_recv with a request argument, so that's
+	where blocked time is taken."""
+
+	global protocol_display
+	if not enabled or protocol_display is not None:
+		return
+	protocol_display = display.display
+	send_and_recv = protocol_display.send_and_recv
+	def timed_send_and_recv(*args, **kwargs):
+		global blocked_total, roundtrips_total
+		if kwargs.get('request') is None:
+			return send_and_recv(*args, **kwargs)
+		start = time.time()
+		try:
+			return send_and_recv(*args, **kwargs)
+		finally:
+			blocked_total += time.time() - start
+			roundtrips_total += 1
+	protocol_display.send_and_recv = timed_send_and_recv
+
+def serial():
+	if protocol_display is None:
+		return 0
+	return protocol_display.request_serial
+
+def measure(names, fn, args, kwargs = {}):
+	"Call fn, counting the call towards the Stats called names."
+
+	serial0, blocked0, roundtrips0 = serial(), blocked_total, roundtrips_total
+	start = time.time()
+	try:
+		return fn(*args, **kwargs)
+	finally:
+		elapsed = time.time() - start
+		# The serial number is only 16 bits.
+		requests = (serial() - serial0) % 65536
+		blocked = blocked_total - blocked0
+		roundtrips = roundtrips_total - roundtrips0
+		for name in names:
+			stat = table.get(name)
+			if stat is None:
+				stat = table[name] = Stat(name)
+			stat.add(elapsed, requests, roundtrips, blocked)
+
+def timed(name, handler):
+	"Return handler, measured as name if stats are on."
+
+	if not enabled:
+		return handler
+	def wrapper(*args, **kwargs):
+		return measure((name,), handler, args, kwargs)
+	return wrapper
+
+def instrument_class(cls, prefix):
+	"""Measure every public method of cls, as prefix.methodname.
+
+	Meant for keys.KeyHandler subclasses, where each method is a key."""
+
+	if not enabled:
+		return
+	for name, value in cls.__dict__.items():
+		if name[0] == '_' or not callable(value):
+			continue
+		setattr(cls, name, timed_method('%s.%s' % (prefix, name), value))
+
+def timed_method(name, function):
+	def method(self, *args, **kwargs):
+		return measure((name,), function, (self,) + args, kwargs)
+	method.__name__ = function.__name__
+	method.__doc__ = function.__doc__
+	return method
+
+def instrument_dispatcher(dispatcher, prefix):
+	"Measure every event dispatched by dispatcher, by event class."
+
+	if not enabled:
+		return
+	dispatch_event = dispatcher.dispatch_event
+	def timed_dispatch(event, *args, **kwargs):
+		return measure(('%s %s' % (prefix, event_name(event)),),
+						dispatch_event, (event,) + args, kwargs)
+	dispatcher.dispatch_event = timed_dispatch
+
+
+event_names = {}
+for _name in ('KeyPress', 'KeyRelease', 'ButtonPress', 'ButtonRelease',
+		'MotionNotify', 'EnterNotify', 'LeaveNotify', 'FocusIn', 'FocusOut',
+		'KeymapNotify', 'Expose', 'GraphicsExpose', 'NoExpose',
+		'VisibilityNotify', 'CreateNotify', 'DestroyNotify', 'UnmapNotify',
+		'MapNotify', 'MapRequest', 'ReparentNotify', 'ConfigureNotify',
+		'ConfigureRequest', 'GravityNotify', 'ResizeRequest',
+		'CirculateNotify', 'CirculateRequest', 'PropertyNotify',
+		'SelectionClear', 'SelectionRequest', 'SelectionNotify',
+		'ColormapNotify', 'ClientMessage', 'MappingNotify'):
+	event_names[getattr(X, _name)] = _name
+
+def event_name(event):
+	"A readable name for an X event or one of our own."
+
+	name = event_names.get(getattr(event, 'type', None))
+	if name is None:
+		name = event.__class__.__name__
+	return name
+
+
+class StatsManager:
+	"""StatsManager - WindowManager mixin measuring every handled event.
+
+	Has to come before wmanager.WindowManager in the bases. If another
+	mixin in between overrides handle_event too, point
+	stats_handle_event at it."""
+
+	stats_handle_event = wmanager.WindowManager.handle_event
+
+	def __wm_init__(self):
+		hook_display(self.display)
+
+	def handle_event(self, event, *args, **kwargs):
+		if not enabled:
+			return self.stats_handle_event(event, *args, **kwargs)
+		return measure(('event ' + event_name(event),),
+			self.stats_handle_event, (event,) + args, kwargs)
+
+
+def dump(f):
+	"Write every Stat to the file object f, slowest total first."
+
+	f.write('%-32s %7s %10s %9s %9s %10s %10s %8s %6s  %s\n' % (
+		'name', 'count', 'total ms', 'mean us', 'max us', 'handler ms',
+		'blocked ms', 'requests', 'trips', 'histogram'))
+	stats = table.values()
+	stats.sort(lambda a, b: cmp(b.total, a.total))
+	for stat in stats:
+		f.write(stat.format() + '\n')
+
+def dump_file(path = None):
+	"Dump the stats to path, by default one in /tmp named after our pid."
+
+	if path is None:
+		path = '/tmp/postmortwm-stats.%d' % os.getpid()
+	f = open(path, 'w')
+	try:
+		dump(f)
+	finally:
+		f.close()
+	return path
+
+def reset():
+	table.clear()
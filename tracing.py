@@ -0,0 +1,173 @@
+#
+# tracing.py -- Cheap debug output and a flight recorder for the wm.
+#
+#	Copyright (C) 2011  Jacob Courtneay <jacob@sporkexec.com>
+#
+#	This program is free software; you can redistribute it and/or modify
+#	it under the terms of the GNU General Public License as published by
+#	the Free Software Foundation; either version 2 of the License, or
+#	(at your option) any later version.
+#
+#	This program is distributed in the hope that it will be useful,
+#	but WITHOUT ANY WARRANTY; without even the implied warranty of
+#	MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#	GNU General Public License for more details.
+#
+#	You should have received a copy of the GNU General Public License
+#	along with this program; if not, write to the Free Software
+#	Foundation, Inc., 59 Temple Place, Suite 330, Boston, MA  02111-1307  USA
+
+"""Tracing - debug messages that cost nothing unless asked for.
+
+debug() takes the format and its arguments separately and only formats
+them, by way of plwm's wmanager.debug, if the category was enabled.
+Categories come from enable() or the POSTMORTWM_TRACE environment
+variable (comma separated, or 'all').
+
+record() notes a wm operation in a fixed-size binary ring buffer, so
+the last few thousand things we did can be dumped after something went
+wrong. It is off unless ring_enable() was called or POSTMORTWM_RING
+gives a number of records to keep. While off, both debug() and record()
+are a function call that returns straight away."""
+
+import os, struct, time
+from plwm import wmanager
+
+enabled = {}
+all_enabled = 0
+
+def _debug(category, fmt, *args):
+	if all_enabled or enabled.has_key(category):
+		wmanager.debug(category, fmt, *args)
+
+def _nodebug(category, fmt, *args):
+	pass
+
+debug = _nodebug
+
+def enable(*categories):
+	"Turn on debug output for categories; 'all' turns on everything."
+
+	global all_enabled, debug
+	for c in categories:
+		if c == 'all':
+			all_enabled = 1
+		else:
+			enabled[c] = 1
+	debug = _debug
+
+def disable(*categories):
+	"Turn debug output for categories back off."
+
+	global all_enabled, debug
+	for c in categories:
+		if c == 'all':
+			all_enabled = 0
+			enabled.clear()
+		else:
+			enabled.pop(c, None)
+	if not all_enabled and not enabled:
+		debug = _nodebug
+
+
+# The flight recorder. Each record is a timestamp, an operation code and
+# five integers whose meaning depends on the operation.
+record_format = '<dHxxiiiii'
+record_size = struct.calcsize(record_format)
+
+ops = []		# code -> name
+op_codes = {}	# name -> code
+
+def op(name):
+	"Return the code for an operation name, registering it if needed."
+
+	code = op_codes.get(name)
+	if code is None:
+		code = op_codes[name] = len(ops)
+		ops.append(name)
+	return code
+
+ring = None
+ring_records = 0
+ring_next = 0
+ring_count = 0
+
+def _record(name, a = 0, b = 0, c = 0, d = 0, e = 0):
+	global ring_next, ring_count
+	struct.pack_into(record_format, ring, ring_next * record_size,
+		time.time(), op(name), a, b, c, d, e)
+	ring_next = (ring_next + 1) % ring_records
+	if ring_count < ring_records:
+		ring_count += 1
+
+def _norecord(name, a = 0, b = 0, c = 0, d = 0, e = 0):
+	pass
+
+record = _norecord
+
+def ring_enable(records = 4096):
+	"Start recording the last records operations."
+
+	global ring, ring_records, ring_next, ring_count, record
+	ring = bytearray(records * record_size)
+	ring_records = records
+	ring_next = ring_count = 0
+	record = _record
+
+def ring_disable():
+	"Stop recording and throw the buffer away."
+
+	global ring, ring_records, ring_next, ring_count, record
+	record = _norecord
+	ring = None
+	ring_records = ring_next = ring_count = 0
+
+def ring_records_list():
+	"Return the recorded operations, oldest first, as tuples."
+
+	out = []
+	start = (ring_next - ring_count) % max(ring_records, 1)
+	for i in xrange(ring_count):
+		slot = (start + i) % ring_records
+		when, code, a, b, c, d, e = struct.unpack_from(record_format, ring,
+			slot * record_size)
+		out.append((when, ops[code], a, b, c, d, e))
+	return out
+
+def dump(f):
+	"Write the recorded operations to the file object f as text."
+
+	for when, name, a, b, c, d, e in ring_records_list():
+		f.write('%.6f %s %d %d %d %d %d\n' % (when, name, a, b, c, d, e))
+
+def dump_file(path = None):
+	"Dump the ring to path, by default one in /tmp named after our pid."
+
+	if path is None:
+		path = '/tmp/postmortwm-trace.%d' % os.getpid()
+	f = open(path, 'w')
+	try:
+		dump(f)
+	finally:
+		f.close()
+	return path
+
+def dump_on_signal(signum):
+	"Dump the ring to its default file whenever we get signal signum."
+
+	import signal
+	signal.signal(signum, lambda signum, frame: dump_file())
+
+
+def setup_from_environment():
+	"Enable whatever POSTMORTWM_TRACE and POSTMORTWM_RING ask for."
+
+	categories = os.environ.get('POSTMORTWM_TRACE')
+	if categories:
+		enable(*[c.strip() for c in categories.split(',') if c.strip()])
+	records = os.environ.get('POSTMORTWM_RING')
+	if records:
+		try:
+			ring_enable(int(records))
+		except ValueError:
+			pass